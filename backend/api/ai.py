@@ -0,0 +1,179 @@
+from dataclasses import dataclass
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .conversations import (
+    aget_room_chain,
+    aprune_room_chain,
+    asave_room_chain,
+    build_turn_inputs,
+    estimate_tokens,
+)
+from .db import arecent_messages
+from .metrics import LLM_TOKENS, group_send, llm_call
+from .persistence import message_document, message_writer
+from .providers import LLMUnavailable
+from .response_cache import normalize, response_cache
+from .scheduler import build_scheduler, log_failure
+from .streaming import new_message_id, stream_reply
+
+
+@dataclass
+class TurnRequest:
+    username: str
+    # The user's own text, as stored; run_turn adds the sender for the prompt
+    message: str
+    # Set when ChatConsumer already stored the user's message
+    user_persisted: bool = False
+    # Stream the reply chunk by chunk instead of sending one chat_message
+    stream: bool = False
+    # Message id promised to an HTTP caller (its jobId) to stream the reply
+    # under; the scheduler never coalesces such requests with others
+    stream_id: str = None
+    # message_id of the stored user message, so the turn's history skips it
+    message_id: str = None
+
+
+def plain_message(username, message):
+    """Strip the "username: " prefix older clients put in front of messages"""
+    prefix = f"{username}: "
+    return message[len(prefix) :] if message.startswith(prefix) else message
+
+
+def without_turn_messages(history, requests):
+    """Drop the turn's own stored messages from the room history
+
+    The write-behind queue may already have stored them, and they are sent
+    as the new message anyway.
+    """
+    ids = {request.message_id for request in requests if request.message_id}
+    unnamed = {
+        (request.username, request.message)
+        for request in requests
+        if request.user_persisted and not request.message_id
+    }
+    return [
+        msg
+        for msg in history
+        if msg.get("message_id") not in ids
+        and (msg["sender"], msg["message"]) not in unnamed
+    ]
+
+
+def cache_key(requests, chain, history):
+    """Question to look up in the response cache, or None to bypass it
+
+    The cache is shared by every room and keyed on the question alone, so
+    only standalone questions use it: a single message of at least
+    AI_RESPONSE_CACHE_MIN_CHARS, asked with no room history and nothing in
+    the conversation memory. Anything else depends on context the key does
+    not capture; a follow-up like "why?" would get another room's answer.
+    """
+    # Coalesced turns answer several messages at once and are never cached
+    if response_cache is None or len(requests) != 1:
+        return None
+    memory = chain.memory
+    if history or memory.chat_memory.messages:
+        return None
+    if getattr(memory, "moving_summary_buffer", ""):
+        return None
+    question = requests[0].message
+    if len(normalize(question)) < settings.AI_RESPONSE_CACHE_MIN_CHARS:
+        return None
+    return question
+
+
+async def broadcast_reply(room_id, reply_id, ai_response, streamed=False):
+    event = {
+        "type": "chat_message",
+        "message": ai_response,
+        "username": "AI",
+        "message_id": reply_id,
+    }
+    if streamed:
+        # Streaming clients expect the reply to end with a "done" event
+        event.update(event="done", seq=0)
+    await group_send(get_channel_layer(), f"room_{room_id}", event)
+
+
+async def run_turn(room_id, requests):
+    """Generate one AI reply for one or more user messages of a room"""
+    # A cold chain is rebuilt from Mongo, which may hold the turn's messages
+    chain, version = await aget_room_chain(
+        room_id, lambda history: without_turn_messages(history, requests)
+    )
+    history = without_turn_messages(await arecent_messages(room_id), requests)
+    user_message = "\n".join(
+        f"{request.username}: {request.message}" for request in requests
+    )
+    inputs = build_turn_inputs(chain, history, user_message)
+
+    stream_id = next((r.stream_id for r in requests if r.stream_id), None)
+    if stream_id is None and any(r.stream for r in requests):
+        stream_id = new_message_id()
+    reply_id = stream_id or new_message_id()
+    question = cache_key(requests, chain, history)
+    cached = response_cache.get(question) if question else None
+
+    if cached is not None:
+        ai_response = cached
+        # The model was skipped, but the memory still has to record the turn
+        await chain.memory.asave_context(
+            chain.prep_inputs(inputs), {chain.output_key: ai_response}
+        )
+        await broadcast_reply(room_id, reply_id, ai_response, streamed=bool(stream_id))
+    elif stream_id:
+        with llm_call("stream"):
+            ai_response = await stream_reply(chain, room_id, inputs, stream_id)
+    else:
+        try:
+            with llm_call("predict"):
+                ai_response = await chain.apredict(**inputs)
+        except LLMUnavailable as e:
+            # Socket clients are waiting on a reply; tell them it is not coming
+            await group_send(
+                get_channel_layer(),
+                f"room_{room_id}",
+                {
+                    "type": "chat_message",
+                    "event": "error",
+                    "message_id": reply_id,
+                    "error": str(e),
+                    "username": "AI",
+                },
+            )
+            raise
+        await broadcast_reply(room_id, reply_id, ai_response)
+
+    if cached is None:
+        # Only the new turn's text; history sent with the prompt is not counted
+        LLM_TOKENS.labels("in").inc(estimate_tokens(inputs["input"]))
+        LLM_TOKENS.labels("out").inc(estimate_tokens(ai_response))
+
+    if question and cached is None:
+        response_cache.put(question, ai_response)
+    await asave_room_chain(
+        room_id,
+        chain,
+        version,
+        chain.prep_inputs(inputs),
+        {chain.output_key: ai_response},
+    )
+
+    documents = [
+        message_document(room_id, request.username, request.message)
+        for request in requests
+        if not request.user_persisted
+    ]
+    documents.append(message_document(room_id, "AI", ai_response, reply_id))
+    message_writer.submit(*documents)
+    return ai_response
+
+
+# Budget-mode summaries are written after the reply, never on its path
+ai_scheduler = build_scheduler(run_turn, after=aprune_room_chain)
+
+
+async def start_turn(room_id, request):
+    """Queue a turn without waiting; the reply reaches the room over the socket"""
+    future = await ai_scheduler.enqueue(room_id, request)
+    future.add_done_callback(log_failure)
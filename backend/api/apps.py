@@ -1,6 +1,29 @@
+import logging
+import threading
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # Registers the "convoroom" channel-layer serializer
+        from . import codec  # noqa: F401
+
+        if settings.MONGO_ENSURE_INDEXES:
+            # Off the startup path: it builds the Mongo client and waits on
+            # the server
+            threading.Thread(
+                target=ensure_indexes_quietly, name="ensure-indexes", daemon=True
+            ).start()
+
+
+def ensure_indexes_quietly():
+    try:
+        from .db import ensure_indexes
+
+        ensure_indexes()
+    except Exception as e:
+        logging.warning(f"Could not ensure MongoDB indexes: {e}")
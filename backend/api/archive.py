@@ -0,0 +1,78 @@
+"""Room history archives: gzip-compressed NDJSON, one message per line
+
+Export reads straight from the Mongo cursor and import writes in batches, so
+both run in constant memory whatever the size of the room.
+"""
+
+import gzip
+import io
+import json
+import zlib
+from django.conf import settings
+from .db import get_db, iter_all_messages, iter_room_messages
+
+ARCHIVE_FIELDS = ("room_id", "message_id", "sender", "message", "timestamp")
+
+
+def archive_lines(room_id=None):
+    """NDJSON lines for one room, or for every room when room_id is None"""
+    messages = iter_room_messages(room_id) if room_id else iter_all_messages()
+    for message in messages:
+        yield json.dumps(message, default=str) + "\n"
+
+
+def gzip_chunks(lines, level=6):
+    """Compress an iterable of text lines into gzip chunks as they come"""
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export_archive(fileobj, room_id=None):
+    """Write a room's (or every room's) archive to a binary file; returns the count"""
+    count = 0
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as archive:
+        for line in archive_lines(room_id):
+            archive.write(line.encode())
+            count += 1
+    return count
+
+
+def import_archive(fileobj, room_id=None, batch_size=None):
+    """Restore messages from a gzip NDJSON stream with batched insert_many
+
+    With `room_id`, every message is restored into that room instead of the
+    one it was exported from. Returns the number of messages inserted;
+    batches written before a malformed line are kept.
+    """
+    batch_size = batch_size or settings.ARCHIVE_IMPORT_BATCH_SIZE
+    collection = get_db()["messages"]
+    count = 0
+    batch = []
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as archive:
+        for number, line in enumerate(io.TextIOWrapper(archive, "utf-8"), 1):
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+            if not isinstance(message, dict) or "message" not in message:
+                raise ValueError(f"Line {number} is not a chat message")
+
+            document = {field: message.get(field) for field in ARCHIVE_FIELDS}
+            if room_id:
+                document["room_id"] = room_id
+            batch.append(document)
+            if len(batch) >= batch_size:
+                collection.insert_many(batch, ordered=False)
+                count += len(batch)
+                batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
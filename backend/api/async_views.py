@@ -0,0 +1,139 @@
+import functools
+import json
+import logging
+import uuid
+from django.http import JsonResponse
+from .db import aget_room_messages, ahistory_page
+from .streaming import new_message_id
+from .ai import TurnRequest, ai_scheduler, plain_message, start_turn
+from .metrics import ERRORS
+from .providers import LLMUnavailable
+from .ratelimit import acheck as rate_limit_check, client_address
+from .room_init import room_initializer
+from .search import asearch_messages, search_params
+from .state import room_state
+from .views import (
+    MAX_PARTICIPANTS,
+    ai_unavailable,
+    history_params,
+    rate_limited,
+    room_creation_busy,
+)
+
+
+def async_api_view(methods):
+    """Async counterpart of DRF's @api_view: method check and CSRF exemption"""
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse(
+                    {"detail": f'Method "{request.method}" not allowed.'}, status=405
+                )
+            return await view(request, *args, **kwargs)
+
+        wrapped.csrf_exempt = True
+        return wrapped
+
+    return decorator
+
+
+@async_api_view(["POST"])
+async def async_getReactData(request):
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+        user_message = data.get("message", "").strip()
+        room_id = data.get("roomId", "").strip()
+        username = data.get("username", "User")
+
+        if not user_message or not room_id:
+            return JsonResponse({"error": "Invalid request"}, status=400)
+
+        wait = await rate_limit_check("ai", client_address(request), room_id)
+        if wait:
+            return rate_limited(JsonResponse, wait)
+
+        turn = TurnRequest(
+            username=username,
+            message=plain_message(username, user_message),
+            user_persisted=bool(data.get("sentOverSocket")),
+            message_id=data.get("messageId"),
+        )
+
+        if data.get("stream"):
+            turn.stream_id = new_message_id()
+            await start_turn(room_id, turn)
+            return JsonResponse(
+                {"jobId": turn.stream_id, "messageId": turn.stream_id, "stream": True},
+                status=202,
+            )
+
+        ai_response = await ai_scheduler.submit(room_id, turn)
+
+        return JsonResponse({"response": ai_response}, status=200)
+
+    except LLMUnavailable as e:
+        logging.warning(f"getReactData: {e}")
+        return ai_unavailable(JsonResponse)
+    except Exception as e:
+        logging.exception("getReactData failed")
+        ERRORS.labels("getReactData").inc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(["GET"])
+async def async_get_chat_history(request, room_id):
+    try:
+        page = history_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if page is not None:
+            return JsonResponse(await ahistory_page(room_id, **page))
+
+        chat_history = await aget_room_messages(room_id)
+        return JsonResponse({"messages": chat_history}, safe=False)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(["GET"])
+async def async_search_room(request, room_id):
+    try:
+        params = search_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        return JsonResponse(await asearch_messages(room_id, **params))
+    except Exception as e:
+        logging.exception("search_room failed")
+        ERRORS.labels("search_room").inc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(["POST"])
+async def async_create_room(request):
+    try:
+        data = json.loads(request.body.decode("utf-8") or "{}")
+        room_id = data.get("roomId", str(uuid.uuid4())[:8])
+        room_name = data.get("room_name", "New Room")
+
+        # submit() never blocks, so it is safe on the event loop
+        if not room_initializer.submit(room_id, room_name, MAX_PARTICIPANTS):
+            return room_creation_busy(JsonResponse)
+
+        await room_state.acreate_room(room_id, MAX_PARTICIPANTS)
+
+        response = {
+            "success": True,
+            "message": "Room created successfully",
+            "roomId": room_id,
+        }
+        return JsonResponse(response)
+    except Exception as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=500)
@@ -0,0 +1,243 @@
+import logging
+from django.conf import settings
+from langchain.memory import (
+    ConversationBufferMemory,
+    ConversationSummaryBufferMemory,
+)
+from langchain.chains import ConversationChain
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import (
+    SystemMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    MessagesPlaceholder,
+)
+from . import services
+from .conversations import estimate_tokens
+
+# Share of CONVERSATION_TOKEN_BUDGET kept for the conversation memory; the
+# rest is left for room messages the memory has not seen
+MEMORY_BUDGET_SHARE = 0.75
+# Once the memory goes over its token limit it is summarised down to this
+# share of the limit, so the summary call runs every few turns, not every turn
+PRUNE_TO_SHARE = 0.5
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """Recent turns within a token budget plus a rolling summary of older ones
+
+    Overflowing turns are folded into the summary incrementally, and token
+    counts are estimated locally instead of asking the model API. Saving a
+    turn never calls the model: the summary is updated by aprune() once the
+    reply has been sent, and a failed summary leaves the turns in the buffer.
+    """
+
+    def buffer_tokens(self):
+        tokens = sum(estimate_tokens(m.content) for m in self.chat_memory.messages)
+        if self.moving_summary_buffer:
+            tokens += estimate_tokens(self.moving_summary_buffer)
+        return tokens
+
+    def _pop_overflow(self):
+        buffer = self.chat_memory.messages
+        tokens = sum(estimate_tokens(m.content) for m in buffer)
+        pruned = []
+        if tokens <= self.max_token_limit:
+            return pruned
+        target = int(self.max_token_limit * PRUNE_TO_SHARE)
+        while buffer and tokens > target:
+            message = buffer.pop(0)
+            tokens -= estimate_tokens(message.content)
+            pruned.append(message)
+        return pruned
+
+    def _restore(self, pruned, error):
+        logging.warning(f"Could not summarise conversation memory: {error}")
+        self.chat_memory.messages[:0] = pruned
+
+    def save_context(self, inputs, outputs):
+        # Record the turn only; pruning is left to prune()/aprune()
+        BaseChatMemory.save_context(self, inputs, outputs)
+
+    async def asave_context(self, inputs, outputs):
+        await BaseChatMemory.asave_context(self, inputs, outputs)
+
+    def prune(self):
+        pruned = self._pop_overflow()
+        if not pruned:
+            return
+        try:
+            self.moving_summary_buffer = self.predict_new_summary(
+                pruned, self.moving_summary_buffer
+            )
+        except Exception as e:
+            self._restore(pruned, e)
+
+    async def aprune(self):
+        """Summarise the overflow, if any; returns whether the memory changed"""
+        pruned = self._pop_overflow()
+        if not pruned:
+            return False
+        try:
+            self.moving_summary_buffer = await self.apredict_new_summary(
+                pruned, self.moving_summary_buffer
+            )
+        except Exception as e:
+            self._restore(pruned, e)
+            return False
+        return True
+
+
+class BoundedBufferMemory(ConversationBufferMemory):
+    """Every exchange, but only the newest `max_messages` messages
+
+    Keeps the prompt and the stored snapshot from growing with the room.
+    """
+
+    max_messages: int = 40
+
+    def prune(self):
+        messages = self.chat_memory.messages
+        if len(messages) > self.max_messages:
+            del messages[: len(messages) - self.max_messages]
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    async def asave_context(self, inputs, outputs):
+        await super().asave_context(inputs, outputs)
+        self.prune()
+
+
+def build_memory(history=()):
+    """Create the memory for a room chain, seeded with stored messages"""
+    if settings.CONVERSATION_MEMORY == "budget":
+        # The memory records only the user's own message; room context is
+        # rebuilt per turn by build_turn_inputs
+        memory = TokenBudgetMemory(
+            llm=services.get("llm"),
+            max_token_limit=int(
+                settings.CONVERSATION_TOKEN_BUDGET * MEMORY_BUDGET_SHARE
+            ),
+            return_messages=True,
+            input_key="message",
+        )
+        # Seed only the newest messages that fit, so rehydrating a room never
+        # needs a summarisation call
+        room = memory.max_token_limit
+        seeded = []
+        for msg in reversed(list(history)):
+            room -= estimate_tokens(msg["message"])
+            if room < 0:
+                break
+            seeded.append(msg)
+        history = reversed(seeded)
+    else:
+        memory = BoundedBufferMemory(
+            max_messages=settings.CONVERSATION_BUFFER_MESSAGES,
+            return_messages=True,
+            input_key="input",
+        )
+
+    for msg in history:
+        if msg["sender"] == "AI":
+            memory.chat_memory.add_ai_message(msg["message"])
+        else:
+            memory.chat_memory.add_user_message(msg["message"])
+    if isinstance(memory, BoundedBufferMemory):
+        memory.prune()
+    return memory
+
+
+async def aprune_memory(memory):
+    """Fold a budget memory's overflow into its summary (a model call)"""
+    if isinstance(memory, TokenBudgetMemory):
+        return await memory.aprune()
+    return False
+
+
+def build_prompt():
+    """Room prompt: the configured instructions as a system message, then history
+
+    This applies the room prompt without the model round trip the old
+    warm-up predict() cost on a room's first message.
+    """
+    return ChatPromptTemplate.from_messages(
+        [
+            SystemMessage(content=settings.AI_ROOM_PROMPT),
+            MessagesPlaceholder(variable_name="history"),
+            HumanMessagePromptTemplate.from_template("{input}"),
+        ]
+    )
+
+
+def build_chain(history=()):
+    """Create a room chain whose memory is seeded with stored messages"""
+    return ConversationChain(
+        llm=services.get("llm"),
+        prompt=build_prompt(),
+        memory=build_memory(history),
+        verbose=False,
+    )
+
+
+def build_turn_inputs(chain, history, user_message):
+    """Chain inputs for one AI turn: recent room messages plus the new message
+
+    With a token-budgeted memory, messages the memory already holds are not
+    repeated and the context is cut to what is left of the budget.
+    """
+    memory = chain.memory
+    if isinstance(memory, TokenBudgetMemory):
+        # The memory holds user turns as "sender: text" lines (several when
+        # messages were coalesced) and seeded messages as plain text
+        seen = set()
+        for m in memory.chat_memory.messages:
+            seen.add(m.content)
+            seen.update(m.content.splitlines())
+        remaining = (
+            settings.CONVERSATION_TOKEN_BUDGET
+            - memory.buffer_tokens()
+            - estimate_tokens(user_message)
+        )
+        unseen = []
+        for msg in reversed(list(history)):
+            line = f"{msg['sender']}: {msg['message']}"
+            if msg["message"] in seen or line in seen:
+                continue
+            remaining -= estimate_tokens(line + "\n")
+            if remaining < 0:
+                break
+            unseen.append(line + "\n")
+        context = "".join(reversed(unseen))
+        if not context:
+            return {"input": user_message, "message": user_message}
+    else:
+        context = "".join(f"{msg['sender']}: {msg['message']}\n" for msg in history)
+
+    return {
+        "input": f"Previous messages in this room:\n{context}\n\nUser's new message: {user_message}",
+        "message": user_message,
+    }
+
+
+def memory_snapshot(memory):
+    return {
+        "messages": messages_to_dict(memory.chat_memory.messages),
+        "summary": getattr(memory, "moving_summary_buffer", ""),
+    }
+
+
+def chain_from_snapshot(snapshot):
+    chain = build_chain()
+    chain.memory.chat_memory.messages = messages_from_dict(snapshot["messages"])
+    if isinstance(chain.memory, TokenBudgetMemory):
+        chain.memory.moving_summary_buffer = snapshot.get("summary", "")
+    else:
+        chain.memory.prune()
+    return chain
@@ -0,0 +1,150 @@
+"""Compact, versioned binary codec for rooms, members and chat messages
+
+Every payload starts with two bytes: the codec version and a schema id.
+Known schemas are packed positionally as a msgpack array:
+``[presence_bitmask, *present_values, extras]``, so field names never go
+over the wire while absent fields and unknown extra keys still round-trip.
+Schema id 0 is a plain msgpack map for anything else.
+
+Unlike pickle, decoding never constructs arbitrary objects, so payloads are
+safe to read back from shared stores such as Redis.
+"""
+
+from datetime import datetime, timezone
+import msgpack
+from channels_redis.serializers import BaseMessageSerializer, registry
+
+CODEC_VERSION = 1
+
+GENERIC = 0
+ROOM = 1
+MEMBER = 2
+MESSAGE = 3
+CHAT_EVENT = 4
+
+SCHEMAS = {
+    ROOM: ("id", "name", "created_at", "member_count"),
+    MEMBER: ("id", "room", "username", "is_active_speaker", "joined_at"),
+    MESSAGE: ("room_id", "message_id", "sender", "message", "timestamp"),
+    # chat_message events sent through the channel layer
+    CHAT_EVENT: (
+        "type",
+        "message",
+        "username",
+        "message_id",
+        "event",
+        "seq",
+        "delta",
+        "client_id",
+        "error",
+        "__asgi_channel__",
+    ),
+}
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # msgpack timestamps must be timezone aware; naive values are UTC here
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _pack(payload):
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+def encode(obj, schema=GENERIC):
+    """Encode a dict with the given schema id"""
+    if schema == GENERIC:
+        return bytes((CODEC_VERSION, GENERIC)) + _pack(obj)
+
+    fields = SCHEMAS[schema]
+    mask = 0
+    values = []
+    for index, field in enumerate(fields):
+        if field in obj:
+            mask |= 1 << index
+            values.append(obj[field])
+    extras = {k: v for k, v in obj.items() if k not in fields}
+    return bytes((CODEC_VERSION, schema)) + _pack([mask, *values, extras or None])
+
+
+def decode(data):
+    """Decode a payload produced by encode(), whatever its schema"""
+    if len(data) < 2:
+        raise CodecError("Payload too short")
+    version, schema = data[0], data[1]
+    if version != CODEC_VERSION:
+        raise CodecError(f"Unsupported codec version {version}")
+    try:
+        payload = msgpack.unpackb(
+            data[2:], raw=False, timestamp=3, strict_map_key=False
+        )
+    except Exception as e:
+        raise CodecError(f"Malformed payload: {e}") from e
+
+    if schema == GENERIC:
+        return payload
+    if schema not in SCHEMAS:
+        raise CodecError(f"Unknown schema {schema}")
+
+    fields = SCHEMAS[schema]
+    if not isinstance(payload, list) or len(payload) < 2:
+        raise CodecError("Malformed payload: expected [mask, *values, extras]")
+    mask, *values, extras = payload
+    if not isinstance(mask, int) or mask < 0 or mask >> len(fields):
+        raise CodecError(f"Malformed payload: bad field mask {mask!r}")
+    if len(values) != bin(mask).count("1"):
+        raise CodecError("Malformed payload: values do not match the field mask")
+    if extras is not None and not isinstance(extras, dict):
+        raise CodecError("Malformed payload: extras must be a map")
+    obj = {}
+    position = 0
+    for index, field in enumerate(fields):
+        if mask & (1 << index):
+            obj[field] = values[position]
+            position += 1
+    if extras:
+        obj.update(extras)
+    return obj
+
+
+def encode_room(room):
+    return encode(room, ROOM)
+
+
+def encode_member(member):
+    return encode(member, MEMBER)
+
+
+def encode_message(message):
+    return encode(message, MESSAGE)
+
+
+def encode_event(event):
+    """Channel-layer events: chat_message gets the positional schema"""
+    if event.get("type") == "chat_message":
+        return encode(event, CHAT_EVENT)
+    return encode(event)
+
+
+class ChannelLayerSerializer(BaseMessageSerializer):
+    """channels_redis serializer using this codec instead of generic msgpack
+
+    Encryption and the random prefix are still handled by the base class.
+    """
+
+    def as_bytes(self, message, *args, **kwargs):
+        return encode_event(message)
+
+    def from_bytes(self, message, *args, **kwargs):
+        return decode(message)
+
+
+registry.register_serializer("convoroom", ChannelLayerSerializer)
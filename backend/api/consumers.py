@@ -1,37 +1,220 @@
+import asyncio
 import json
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from .ai import TurnRequest, start_turn
+from .db import amessages_since
+from .metrics import ACTIVE_CONNECTIONS, WEBSOCKET_SECONDS, group_send, timed
+from .outbox import SendBuffer
+from .persistence import message_document, message_writer
+from .ratelimit import acheck as rate_limit_check
+from .state import arecover_room, room_state
+from .streaming import new_message_id
+
+# Close codes sent when a connection is refused a participant slot
+CLOSE_ROOM_FULL = 4003
+CLOSE_ROOM_MISSING = 4004
+
+ADMISSION_ERRORS = {
+    "full": (CLOSE_ROOM_FULL, "Room is full"),
+    "missing": (CLOSE_ROOM_MISSING, "Room not found or does not exist"),
+}
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    admitted = False
+
+    @timed(WEBSOCKET_SECONDS, "connect")
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_id"]
         self.room_group_name = f"room_{self.room_name}"
 
+        # The participant slot is taken atomically here and released in
+        # disconnect(); join_room only checks that one is free
+        admission = await self.admit()
+        if admission != "joined":
+            await self.refuse(admission)
+            return
+
+        # ws/room/<id>/?since=<message_id> or ?since_ts=<timestamp>, plus
+        # ?batch=1 and ?compress=deflate for batched / compressed frames
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.outbox = SendBuffer(
+            self.send,
+            window=settings.WS_BATCH_WINDOW if "batch" in query else 0,
+            max_events=settings.WS_BATCH_MAX_EVENTS,
+            compress_min=(
+                settings.WS_COMPRESS_MIN_BYTES
+                if query.get("compress") == ["deflate"]
+                else None
+            ),
+        )
+
+        self.admitted = True
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        ACTIVE_CONNECTIONS.inc()
+        self.heartbeat = asyncio.create_task(self.keep_presence())
         await self.send(
             text_data=json.dumps(
                 {"message": f"You are now connected to room {self.room_name}"}
             )
         )
 
+        since = query.get("since", [None])[0]
+        since_ts = query.get("since_ts", [None])[0]
+        if since or since_ts:
+            await self.replay(since, since_ts)
+
+    async def admit(self):
+        admission = await room_state.aadmit(self.room_name, self.channel_name)
+        if admission == "missing" and await arecover_room(self.room_name):
+            admission = await room_state.aadmit(self.room_name, self.channel_name)
+        return admission
+
+    async def refuse(self, admission, accepted=False):
+        code, error = ADMISSION_ERRORS[admission]
+        if not accepted:
+            # Accept first so the browser sees the reason and the close code
+            await self.accept()
+        else:
+            await self.outbox.flush()
+        await self.send(text_data=json.dumps({"type": "error", "error": error}))
+        await self.close(code=code)
+
+    async def keep_presence(self):
+        """Renew the participant slot until the socket closes"""
+        while True:
+            await asyncio.sleep(settings.ROOM_HEARTBEAT_INTERVAL)
+            try:
+                admission = await self.admit()
+            except Exception as e:
+                logging.warning(f"Presence heartbeat failed for {self.room_name}: {e}")
+                continue
+            if admission != "joined":
+                # The slot expired (e.g. Redis was unreachable) and was taken
+                await self.refuse(admission, accepted=True)
+                return
+
     async def disconnect(self, close_code):
+        if not self.admitted:
+            return
+        self.admitted = False
+        self.heartbeat.cancel()
+        self.outbox.close()
+        ACTIVE_CONNECTIONS.dec()
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await room_state.aleave(self.room_name, self.channel_name)
 
+    @timed(WEBSOCKET_SECONDS, "receive")
     async def receive(self, text_data):
         data = json.loads(text_data)
+        if data.get("type") == "chat":
+            await self.receive_chat(data)
+            return
+        if data.get("type") == "sync":
+            if not await self.rate_limited("sync", data):
+                await self.replay(data.get("since"), data.get("sinceTimestamp"))
+            return
+
         message = data["message"]
         username = data.get("username", "User")
+        if await self.rate_limited("message", data):
+            return
+        message_id = new_message_id()
+
+        # Queued for a batched write; persistence never delays the broadcast
+        message_writer.submit(
+            message_document(self.room_name, username, message, message_id)
+        )
 
         # Broadcast the message
-        await self.channel_layer.group_send(
+        await group_send(
+            self.channel_layer,
             self.room_group_name,
             {
                 "type": "chat_message",
                 "message": message,
                 "username": username,
+                "message_id": message_id,
             },
         )
 
+    async def receive_chat(self, data):
+        """Persist, broadcast and (unless "ai" is false) answer a message in one pass"""
+        message = data.get("message", "").strip()
+        if not message:
+            return
+        username = data.get("username", "User")
+        if await self.rate_limited("message", data):
+            return
+        # Checked before the broadcast; a refused AI turn still sends the message
+        wants_ai = data.get("ai", True) and not await self.rate_limited("ai", data)
+        message_id = new_message_id()
+
+        message_writer.submit(
+            message_document(self.room_name, username, message, message_id)
+        )
+        await group_send(
+            self.channel_layer,
+            self.room_group_name,
+            {
+                "type": "chat_message",
+                "message": message,
+                "username": username,
+                "message_id": message_id,
+                # Lets the sender match the echo with its optimistic copy
+                "client_id": data.get("clientId"),
+            },
+        )
+
+        if wants_ai:
+            await start_turn(
+                self.room_name,
+                TurnRequest(
+                    username=username,
+                    message=message,
+                    user_persisted=True,
+                    message_id=message_id,
+                    stream=bool(data.get("stream")),
+                ),
+            )
+
+    async def rate_limited(self, kind, data):
+        """Tell the client to back off instead of dropping its message silently"""
+        # Charged to the connection: the username is whatever the client sends
+        wait = await rate_limit_check(kind, self.channel_name, self.room_name)
+        if not wait:
+            return False
+        await self.outbox.send_now(
+            {
+                "type": "rate_limited",
+                "scope": kind,
+                "retryAfter": round(wait, 2),
+                "clientId": data.get("clientId"),
+            }
+        )
+        return True
+
+    async def replay(self, since=None, since_ts=None):
+        """Send the messages this client missed while it was disconnected"""
+        try:
+            messages, complete = await amessages_since(
+                self.room_name, message_id=since, timestamp=since_ts
+            )
+        except Exception as e:
+            logging.warning(f"History replay failed for {self.room_name}: {e}")
+            await self.outbox.send_now(
+                {"type": "error", "error": "History sync failed"}
+            )
+            return
+        # "reset" tells the client the gap could not be bridged, so the
+        # messages replace what it has instead of being appended
+        await self.outbox.send_now(
+            {"type": "history", "messages": messages, "reset": not complete}
+        )
+
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.outbox.push(event)
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .db import arecent_messages, recent_messages
+from .state import MemoryConflict, room_state
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def _chains():
+    # langchain is only imported once a chain is actually needed
+    from . import chains
+
+    return chains
+
+
+class ConversationStore:
+    """LRU + idle-timeout cache of per-room ConversationChain objects
+
+    Evicted rooms are rebuilt from the shared room state or the Mongo
+    `messages` collection the next time they are used, so memory stays
+    bounded by `max_rooms`. Each entry remembers the shared memory version it
+    was built from; a lookup with a different version is treated as a miss.
+    """
+
+    def __init__(self, max_rooms, idle_timeout):
+        self.max_rooms = max_rooms
+        self.idle_timeout = idle_timeout
+        self._chains = OrderedDict()  # room_id -> (chain, last_used, version)
+        self._lock = threading.Lock()
+
+    def __contains__(self, room_id):
+        with self._lock:
+            return room_id in self._chains
+
+    def __len__(self):
+        with self._lock:
+            return len(self._chains)
+
+    def get(self, room_id, version=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._chains.get(room_id)
+            if entry is None:
+                return None
+            chain, last_used, cached_version = entry
+            expired = self.idle_timeout and now - last_used > self.idle_timeout
+            if expired or cached_version != version:
+                del self._chains[room_id]
+                return None
+            self._chains[room_id] = (chain, now, version)
+            self._chains.move_to_end(room_id)
+            return chain
+
+    def put(self, room_id, chain, version=None):
+        with self._lock:
+            self._chains[room_id] = (chain, time.monotonic(), version)
+            self._chains.move_to_end(room_id)
+            self._evict()
+
+    def pop(self, room_id):
+        with self._lock:
+            entry = self._chains.pop(room_id, None)
+        return entry[0] if entry else None
+
+    def _evict(self):
+        if self.idle_timeout:
+            cutoff = time.monotonic() - self.idle_timeout
+            # Entries are in last-used order, so idle ones sit at the front
+            while self._chains:
+                room_id, (_, last_used, _) = next(iter(self._chains.items()))
+                if last_used >= cutoff:
+                    break
+                del self._chains[room_id]
+        while len(self._chains) > self.max_rooms:
+            self._chains.popitem(last=False)
+
+
+room_conversations = ConversationStore(
+    max_rooms=settings.CONVERSATION_CACHE_MAX_ROOMS,
+    idle_timeout=settings.CONVERSATION_IDLE_TIMEOUT,
+)
+
+
+def build_turn_inputs(chain, history, user_message):
+    return _chains().build_turn_inputs(chain, history, user_message)
+
+
+def get_room_chain(room_id):
+    """Return the chain for a room
+
+    The chain comes from the local cache if it matches the shared memory
+    version, then from the shared room state, and is otherwise rehydrated
+    from Mongo.
+    """
+    version = room_state.memory_version(room_id)
+    chain = room_conversations.get(room_id, version)
+    if chain is not None:
+        return chain
+
+    stored = room_state.load_memory(room_id)
+    if stored is not None:
+        version, snapshot = stored
+        chain = _chains().chain_from_snapshot(snapshot)
+        room_conversations.put(room_id, chain, version)
+        return chain
+
+    chain = _chains().build_chain(
+        recent_messages(room_id, settings.CONVERSATION_REHYDRATE_MESSAGES)
+    )
+    room_conversations.put(room_id, chain, version)
+    return chain
+
+
+async def aget_room_chain(room_id, history_filter=None):
+    """Return (chain, version): the version of the shared memory it matches
+
+    `history_filter`, when given, is applied to the stored messages a chain
+    is rebuilt from (run_turn drops the turn's own messages with it).
+    """
+    version = await room_state.amemory_version(room_id)
+    chain = room_conversations.get(room_id, version)
+    if chain is not None:
+        return chain, version
+
+    stored = await room_state.aload_memory(room_id)
+    if stored is not None:
+        version, snapshot = stored
+        chain = _chains().chain_from_snapshot(snapshot)
+        room_conversations.put(room_id, chain, version)
+        return chain, version
+
+    history = await arecent_messages(room_id, settings.CONVERSATION_REHYDRATE_MESSAGES)
+    if history_filter is not None:
+        history = history_filter(history)
+    chain = _chains().build_chain(history)
+    room_conversations.put(room_id, chain, version)
+    return chain, version
+
+
+async def asave_room_chain(room_id, chain, version, inputs, outputs):
+    """Publish a room's memory to the shared room state after a turn
+
+    `chain` was loaded at `version` and has since recorded the turn's
+    `inputs` and `outputs`. The save is refused when another worker saved
+    the room in between; the newer memory is then reloaded, the turn is
+    recorded in it again and the save retried, so neither turn is lost.
+    """
+    for attempt in range(settings.CONVERSATION_SAVE_RETRIES + 1):
+        try:
+            version = await room_state.asave_memory(
+                room_id, _chains().memory_snapshot(chain.memory), version
+            )
+        except MemoryConflict:
+            if attempt == settings.CONVERSATION_SAVE_RETRIES:
+                break
+            stored = await room_state.aload_memory(room_id)
+            if stored is None:
+                # Expired in between; this turn's memory is all there is
+                version = await room_state.amemory_version(room_id)
+                continue
+            version, snapshot = stored
+            chain = _chains().chain_from_snapshot(snapshot)
+            await chain.memory.asave_context(inputs, outputs)
+        else:
+            room_conversations.put(room_id, chain, version)
+            return chain
+    logging.warning(f"Gave up saving the memory of room {room_id} after conflicts")
+    # The next turn reloads whatever memory won
+    room_conversations.pop(room_id)
+    return chain
+
+
+async def aprune_room_chain(room_id):
+    """Fold a room's overflowing turns into its summary after a turn
+
+    Runs once the reply has been sent; the turn itself is already saved. If
+    another worker saved the room meanwhile the summary is dropped, and a
+    later turn prunes the newer memory instead.
+    """
+    if settings.CONVERSATION_MEMORY != "budget":
+        return
+    chain, version = await aget_room_chain(room_id)
+    if not await _chains().aprune_memory(chain.memory):
+        return
+    try:
+        version = await room_state.asave_memory(
+            room_id, _chains().memory_snapshot(chain.memory), version
+        )
+    except MemoryConflict:
+        room_conversations.pop(room_id)
+        return
+    room_conversations.put(room_id, chain, version)
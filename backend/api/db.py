@@ -0,0 +1,273 @@
+import asyncio
+import base64
+import weakref
+from bson import ObjectId
+from django.conf import settings
+from . import services
+from .metrics import MONGO_SECONDS, timed
+
+if settings.MONGO_URI is None:
+    raise ValueError("DATABASE_URL environment variable not set")
+
+
+# pymongo's sort directions; pymongo itself is only imported when the first
+# client is built (see api.services)
+ASCENDING = 1
+DESCENDING = -1
+TEXT = "text"
+
+
+def client_options():
+    return {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+
+
+# Motor clients are bound to the event loop they are first used on, so keep
+# one per loop (Daphne's main loop plus any loop started by async_to_sync).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_db():
+    return services.get("mongo")[settings.MONGO_DB_NAME]
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async_client = AsyncIOMotorClient(
+            settings.MONGO_URI, io_loop=loop, **client_options()
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+
+def get_async_db():
+    return get_async_client()[settings.MONGO_DB_NAME]
+
+
+def ensure_indexes():
+    """Create the indexes the hot-path queries rely on (idempotent)"""
+    messages = get_db()["messages"]
+    # History pages, the NDJSON stream and reconnect replays sort on
+    # (timestamp, _id) within a room; with _id in the index MongoDB walks it
+    # in order instead of sorting the whole room in memory
+    messages.create_index(
+        [("room_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+        name="room_id_timestamp_id",
+    )
+    # Superseded by room_id_timestamp_id, which has it as a prefix
+    if "room_id_timestamp" in messages.index_information():
+        messages.drop_index("room_id_timestamp")
+    # Resolves the last-seen message of a reconnecting client
+    messages.create_index(
+        [("room_id", ASCENDING), ("message_id", ASCENDING)],
+        name="room_id_message_id",
+    )
+    # Room-scoped full-text search (api/search.py); MongoDB allows a single
+    # text index per collection
+    messages.create_index(
+        [("room_id", ASCENDING), ("message", TEXT)],
+        name="room_id_message_text",
+    )
+    # Looks up rooms whose shared room state is gone (api.state.recover_room)
+    get_db()["rooms"].create_index([("room_id", ASCENDING)], name="room_id")
+
+
+def _room_query(room_id):
+    return {"room_id": room_id, "active": {"$ne": False}}, {
+        "_id": 0,
+        "max_participants": 1,
+    }
+
+
+@timed(MONGO_SECONDS, "find_room")
+def find_room(room_id):
+    """The stored `rooms` document of an active room, or None"""
+    return get_db()["rooms"].find_one(*_room_query(room_id))
+
+
+@timed(MONGO_SECONDS, "find_room")
+async def afind_room(room_id):
+    return await get_async_db()["rooms"].find_one(*_room_query(room_id))
+
+
+def _recent_query(collection, room_id, limit):
+    # Walk the (room_id, timestamp) index backwards so only `limit` documents
+    # are read, whatever the size of the room
+    return (
+        collection.find({"room_id": room_id}, {"_id": 0})
+        .sort("timestamp", DESCENDING)
+        .limit(limit)
+    )
+
+
+@timed(MONGO_SECONDS, "recent_messages")
+def recent_messages(room_id, limit=None):
+    """Return the last `limit` messages of a room, oldest first"""
+    limit = limit or settings.RECENT_CONTEXT_MESSAGES
+    messages = list(_recent_query(get_db()["messages"], room_id, limit))
+    messages.reverse()
+    return messages
+
+
+@timed(MONGO_SECONDS, "recent_messages")
+async def arecent_messages(room_id, limit=None):
+    limit = limit or settings.RECENT_CONTEXT_MESSAGES
+    cursor = _recent_query(get_async_db()["messages"], room_id, limit)
+    messages = await cursor.to_list(length=limit)
+    messages.reverse()
+    return messages
+
+
+@timed(MONGO_SECONDS, "get_room_messages")
+async def aget_room_messages(room_id):
+    """Return every message of a room, oldest first"""
+    cursor = (
+        get_async_db()["messages"]
+        .find({"room_id": room_id}, {"_id": 0})
+        .sort("timestamp")
+    )
+    return await cursor.to_list(length=None)
+
+
+def encode_cursor(message):
+    raw = f"{message['timestamp']}|{message['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, ObjectId) for a cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, _id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return timestamp, ObjectId(_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _seek(cursor, op):
+    """Filter clause for messages strictly after ($gt) or before ($lt) a cursor"""
+    return _seek_position(*decode_cursor(cursor), op)
+
+
+def _seek_position(timestamp, _id, op):
+    return [
+        {"timestamp": {op: timestamp}},
+        {"timestamp": timestamp, "_id": {op: _id}},
+    ]
+
+
+def _page_query(room_id, before, after):
+    """Build filter and sort for a page, seeking on (timestamp, _id)"""
+    query = {"room_id": room_id}
+    if after:
+        query["$or"] = _seek(after, "$gt")
+        return query, [("timestamp", ASCENDING), ("_id", ASCENDING)]
+    if before:
+        query["$or"] = _seek(before, "$lt")
+    # Without a cursor the page is the newest `limit` messages
+    return query, [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+
+def _build_page(documents, limit, after):
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if not after:
+        documents.reverse()
+
+    next_cursor = None
+    if has_more and documents:
+        # Paging forwards continues after the newest message, paging
+        # backwards continues before the oldest one
+        next_cursor = encode_cursor(documents[-1] if after else documents[0])
+
+    for document in documents:
+        del document["_id"]
+    return {"messages": documents, "next_cursor": next_cursor, "has_more": has_more}
+
+
+@timed(MONGO_SECONDS, "history_page")
+def history_page(room_id, before=None, after=None, limit=None):
+    """Return one page of a room's history, oldest first, plus the next cursor"""
+    limit = min(limit or settings.HISTORY_PAGE_SIZE, settings.HISTORY_MAX_PAGE_SIZE)
+    query, sort = _page_query(room_id, before, after)
+    documents = list(get_db()["messages"].find(query).sort(sort).limit(limit + 1))
+    return _build_page(documents, limit, after)
+
+
+@timed(MONGO_SECONDS, "history_page")
+async def ahistory_page(room_id, before=None, after=None, limit=None):
+    limit = min(limit or settings.HISTORY_PAGE_SIZE, settings.HISTORY_MAX_PAGE_SIZE)
+    query, sort = _page_query(room_id, before, after)
+    cursor = get_async_db()["messages"].find(query).sort(sort).limit(limit + 1)
+    documents = await cursor.to_list(length=limit + 1)
+    return _build_page(documents, limit, after)
+
+
+@timed(MONGO_SECONDS, "messages_since")
+async def amessages_since(room_id, message_id=None, timestamp=None, limit=None):
+    """Messages a reconnecting client missed, oldest first
+
+    The client names the last message it saw by id or, failing that, by
+    timestamp. Returns (messages, complete): when the anchor is unknown or
+    more than `limit` messages were missed, complete is False and messages is
+    only the newest `limit` of the room.
+    """
+    limit = limit or settings.SYNC_MAX_MESSAGES
+    collection = get_async_db()["messages"]
+    query = None
+    if message_id:
+        anchor = await collection.find_one(
+            {"room_id": room_id, "message_id": message_id}, {"timestamp": 1}
+        )
+        if anchor is not None:
+            query = {
+                "room_id": room_id,
+                "$or": _seek_position(anchor["timestamp"], anchor["_id"], "$gt"),
+            }
+    elif timestamp:
+        query = {"room_id": room_id, "timestamp": {"$gt": timestamp}}
+
+    if query is not None:
+        cursor = (
+            collection.find(query, {"_id": 0})
+            .sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+            .limit(limit + 1)
+        )
+        documents = await cursor.to_list(length=limit + 1)
+        if len(documents) <= limit:
+            return documents, True
+    return await arecent_messages(room_id, limit), False
+
+
+def iter_room_messages(room_id, after=None):
+    """Yield a room's messages oldest first straight from the Mongo cursor"""
+    query = {"room_id": room_id}
+    if after:
+        query["$or"] = _seek(after, "$gt")
+    cursor = (
+        get_db()["messages"]
+        .find(query, {"_id": 0})
+        .sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+        .batch_size(settings.HISTORY_STREAM_BATCH_SIZE)
+    )
+    yield from cursor
+
+
+def iter_all_messages():
+    """Yield every message, room by room, oldest first within each room"""
+    # Sorting on the (room_id, timestamp) index keeps this a streaming scan
+    cursor = (
+        get_db()["messages"]
+        .find({}, {"_id": 0})
+        .sort([("room_id", ASCENDING), ("timestamp", ASCENDING)])
+        .batch_size(settings.HISTORY_STREAM_BATCH_SIZE)
+    )
+    yield from cursor
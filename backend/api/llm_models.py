@@ -0,0 +1,228 @@
+import asyncio
+import re
+import time
+from typing import Any, Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from .metrics import LLM_EVENTS
+from .providers import LLMUnavailable
+
+
+def _result(message):
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline chat model (LLM_PROVIDER=stub)
+
+    The reply only depends on the last message, so runs are reproducible
+    without network access; `latency` seconds are slept per call to stand in
+    for the model.
+    """
+
+    model: str = "stub"
+    latency: float = 0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _reply(self, messages):
+        content = messages[-1].content if messages else ""
+        text = content if isinstance(content, str) else str(content)
+        return f"Stub reply to: {text.strip()[-200:]}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return _result(AIMessage(content=self._reply(messages)))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _result(AIMessage(content=self._reply(messages)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for word in re.findall(r"\S+\s*", self._reply(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+class ResilientChatModel(BaseChatModel):
+    """A primary chat model with a deadline, hedging, a breaker and a fallback
+
+    Every async call must finish within `timeout` seconds, of which the last
+    `fallback_reserve` are kept for the fallback when there is one. A primary
+    attempt that fails is retried, and one still pending after `hedge_delay`
+    seconds is raced by a second identical request (0 disables hedging), up
+    to `max_attempts` in total; the first answer wins and the rest are
+    cancelled. Failures feed `breaker`, and while it is open the primary is
+    skipped. Calls the primary cannot serve go to `fallback`, and raise
+    LLMUnavailable when there is none or it fails too.
+    """
+
+    primary: BaseChatModel
+    fallback: Optional[BaseChatModel] = None
+    timeout: float = 30
+    fallback_reserve: float = 0
+    hedge_delay: float = 0
+    max_attempts: int = 2
+    breaker: Any = None
+
+    @property
+    def _llm_type(self):
+        return "resilient"
+
+    async def _hedged(self, messages, stop, deadline, **kwargs):
+        loop = asyncio.get_running_loop()
+        pending = set()
+        launched = 0
+        error = None
+
+        def launch():
+            nonlocal launched
+            launched += 1
+            call = self.primary.ainvoke(messages, stop=stop, **kwargs)
+            pending.add(asyncio.ensure_future(call))
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                can_hedge = bool(self.hedge_delay) and launched < self.max_attempts
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=(
+                        min(self.hedge_delay, remaining) if can_hedge else remaining
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if launched < self.max_attempts and (done or can_hedge):
+                    LLM_EVENTS.labels("retry" if done else "hedge").inc()
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        if pending or error is None:
+            LLM_EVENTS.labels("timeout").inc()
+            raise asyncio.TimeoutError("No reply before the deadline")
+        raise error
+
+    def _primary_allowed(self):
+        if self.breaker.allow():
+            return True
+        LLM_EVENTS.labels("short_circuit").inc()
+        return False
+
+    def _no_fallback(self, error):
+        message = "AI model unavailable"
+        if error is not None:
+            message = f"{message}: {error}"
+        return LLMUnavailable(message)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        error = None
+        if self._primary_allowed():
+            reserve = self.fallback_reserve if self.fallback is not None else 0
+            try:
+                message = await self._hedged(
+                    messages, stop, deadline - reserve, **kwargs
+                )
+            except Exception as e:
+                self.breaker.failure()
+                error = e
+            except BaseException:
+                # Cancelled: no outcome, but a trial call must not stay taken
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.success()
+                return _result(message)
+
+        if self.fallback is None:
+            raise self._no_fallback(error) from error
+        LLM_EVENTS.labels("fallback").inc()
+        try:
+            message = await asyncio.wait_for(
+                self.fallback.ainvoke(messages, stop=stop, **kwargs),
+                max(0, deadline - loop.time()),
+            )
+        except Exception as e:
+            raise self._no_fallback(e) from e
+        return _result(message)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Not hedged: chunks already sent to the room cannot be taken back, so
+        # the fallback only takes over when the primary fails before its first
+        # chunk. `timeout` bounds the wait for each chunk.
+        models = [self.primary] if self._primary_allowed() else []
+        if self.fallback is not None:
+            models.append(self.fallback)
+        error = None
+        for model in models:
+            if model is self.fallback:
+                LLM_EVENTS.labels("fallback").inc()
+            stream = model.astream(messages, stop=stop, **kwargs).__aiter__()
+            started = False
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    # Models without native streaming yield one whole AIMessage
+                    if not isinstance(chunk, AIMessageChunk):
+                        chunk = AIMessageChunk(content=chunk.content)
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                if model is self.primary:
+                    self.breaker.failure()
+                if started:
+                    raise
+                error = e
+                continue
+            except BaseException:
+                # Cancelled, or the consumer closed the stream (GeneratorExit)
+                if model is self.primary:
+                    self.breaker.abandon()
+                raise
+            if model is self.primary:
+                self.breaker.success()
+            return
+        raise self._no_fallback(error) from error
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        # Sync callers (memory summaries) get the breaker and the fallback; the
+        # deadline is the provider's own request timeout
+        error = None
+        if self._primary_allowed():
+            try:
+                message = self.primary.invoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self.breaker.failure()
+                error = e
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.success()
+                return _result(message)
+
+        if self.fallback is None:
+            raise self._no_fallback(error) from error
+        LLM_EVENTS.labels("fallback").inc()
+        try:
+            return _result(self.fallback.invoke(messages, stop=stop, **kwargs))
+        except Exception as e:
+            raise self._no_fallback(e) from e
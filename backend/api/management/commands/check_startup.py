@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that must stay out of a fresh process until a request needs them
+# (see api.services)
+LAZY_MODULES = ("langchain", "langchain_google_genai", "pymongo", "motor")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import backend.asgi, backend.urls
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "ms": elapsed * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the ASGI application and URLconf in a fresh interpreter and fail "
+        "if it takes longer than STARTUP_IMPORT_BUDGET_MS or loads a lazy client"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget-ms", type=float, default=settings.STARTUP_IMPORT_BUDGET_MS
+        )
+        parser.add_argument(
+            "--runs", type=int, default=3, help="keep the fastest of this many runs"
+        )
+
+    def probe(self):
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+        # Index creation is a network round trip, not import cost
+        env["MONGO_ENSURE_INDEXES"] = "False"
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE % (LAZY_MODULES,)],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Startup probe failed:\n{result.stderr}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        runs = [self.probe() for _ in range(max(1, options["runs"]))]
+        fastest = min(run["ms"] for run in runs)
+        loaded = sorted({module for run in runs for module in run["loaded"]})
+        self.stdout.write(
+            f"Startup imports: {fastest:.0f} ms (budget {options['budget_ms']:.0f} ms)"
+        )
+
+        problems = []
+        if fastest > options["budget_ms"]:
+            problems.append(f"{fastest:.0f} ms exceeds the startup budget")
+        if loaded:
+            problems.append(f"imported at startup: {', '.join(loaded)}")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Startup is within budget"))
@@ -0,0 +1,20 @@
+import sys
+from django.core.management.base import BaseCommand
+from api.archive import export_archive
+
+
+class Command(BaseCommand):
+    help = "Export room history as a gzip-compressed NDJSON archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="archive path, or - for stdout")
+        parser.add_argument("--room", help="export only this room (default: all)")
+
+    def handle(self, *args, **options):
+        if options["output"] == "-":
+            count = export_archive(sys.stdout.buffer, options["room"])
+        else:
+            with open(options["output"], "wb") as output:
+                count = export_archive(output, options["room"])
+        # stdout may be the archive itself, so report on stderr
+        self.stderr.write(f"Exported {count} messages")
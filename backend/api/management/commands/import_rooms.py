@@ -0,0 +1,29 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api.archive import import_archive
+
+
+class Command(BaseCommand):
+    help = "Restore messages from a gzip-compressed NDJSON room archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="archive path, or - for stdin")
+        parser.add_argument(
+            "--room", help="restore every message into this room instead"
+        )
+        parser.add_argument("--batch-size", type=int, help="messages per insert_many")
+
+    def handle(self, *args, **options):
+        try:
+            if options["input"] == "-":
+                count = import_archive(
+                    sys.stdin.buffer, options["room"], options["batch_size"]
+                )
+            else:
+                with open(options["input"], "rb") as archive:
+                    count = import_archive(
+                        archive, options["room"], options["batch_size"]
+                    )
+        except (OSError, EOFError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Imported {count} messages"))
@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+LLM_SECONDS = Histogram(
+    "convoroom_llm_seconds",
+    "Latency of LLM calls",
+    ["mode"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+LLM_ERRORS = Counter("convoroom_llm_errors_total", "Failed LLM calls", ["mode"])
+LLM_EVENTS = Counter(
+    "convoroom_llm_events_total",
+    "LLM retries, hedges, timeouts, fallbacks and circuit-breaker events",
+    ["event"],
+)
+LLM_TOKENS = Counter(
+    "convoroom_llm_tokens_total", "Estimated LLM tokens", ["direction"]
+)
+MONGO_SECONDS = Histogram(
+    "convoroom_mongo_seconds", "Latency of MongoDB operations", ["operation"]
+)
+CHANNEL_SEND_SECONDS = Histogram(
+    "convoroom_channel_send_seconds", "Latency of channel-layer group sends"
+)
+WEBSOCKET_SECONDS = Histogram(
+    "convoroom_websocket_seconds", "Time spent in ChatConsumer handlers", ["handler"]
+)
+ACTIVE_CONNECTIONS = Gauge(
+    "convoroom_websocket_connections", "Open ChatConsumer connections"
+)
+CACHED_ROOMS = Gauge(
+    "convoroom_cached_rooms", "Rooms with a conversation chain in room_conversations"
+)
+PENDING_ROOM_INITS = Gauge(
+    "convoroom_pending_room_inits", "Rooms waiting for background initialisation"
+)
+RESPONSE_CACHE_EVENTS = Gauge(
+    "convoroom_response_cache_events", "AI response cache counters", ["event"]
+)
+WEBSOCKET_FRAMES = Counter(
+    "convoroom_websocket_frames_total",
+    "Frames sent to WebSocket clients",
+    ["kind", "encoding"],
+)
+WEBSOCKET_BYTES = Counter(
+    "convoroom_websocket_bytes_total",
+    "Payload bytes sent to WebSocket clients",
+    ["encoding"],
+)
+RATE_LIMITED = Counter(
+    "convoroom_rate_limited_total", "Requests refused by the rate limiter", ["kind"]
+)
+ERRORS = Counter("convoroom_errors_total", "Unhandled errors", ["where"])
+
+
+def timed(histogram, *labels):
+    """Decorator observing a function's duration; works for sync and async"""
+    metric = histogram.labels(*labels) if labels else histogram
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    metric.observe(time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    metric.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def llm_call(mode):
+    """Time an LLM call and count it as failed if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_ERRORS.labels(mode).inc()
+        raise
+    finally:
+        LLM_SECONDS.labels(mode).observe(time.perf_counter() - start)
+
+
+async def group_send(channel_layer, group, event):
+    start = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, event)
+    finally:
+        CHANNEL_SEND_SECONDS.observe(time.perf_counter() - start)
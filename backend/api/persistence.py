@@ -0,0 +1,146 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from .db import get_db
+from .metrics import ERRORS, MONGO_SECONDS
+from .streaming import new_message_id
+
+_STOP = object()
+
+DUPLICATE_KEY = 11000
+MAX_RETRY_DELAY = 8
+
+
+class MessageWriter:
+    """Write-behind buffer for chat messages
+
+    Callers (sync views, async views and consumers alike) only enqueue a
+    document; a background thread writes them with insert_many once
+    `batch_size` documents are waiting or `flush_interval` seconds have
+    passed, and drains whatever is left when the process exits.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_queue):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="message-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, *documents):
+        self._ensure_started()
+        for document in documents:
+            try:
+                self._queue.put_nowait(document)
+            except queue.Full:
+                # Never drop a message: write it directly when the buffer is
+                # full, in a worker thread when called from the event loop
+                logging.warning("Message write buffer full, writing directly")
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    self._write([document])
+                else:
+                    loop.run_in_executor(None, self._write, [document])
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or (
+                batch and time.monotonic() >= deadline
+            ):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+    def _write(self, batch):
+        """insert_many with retries; only documents not yet stored are retried"""
+        delay = settings.MESSAGE_WRITE_RETRY_DELAY
+        for attempt in range(settings.MESSAGE_WRITE_RETRIES + 1):
+            if not batch:
+                return
+            if attempt:
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            try:
+                with MONGO_SECONDS.labels("insert_messages").time():
+                    get_db()["messages"].insert_many(batch, ordered=False)
+                return
+            except Exception as e:
+                logging.warning(
+                    f"Persisting {len(batch)} messages failed "
+                    f"(attempt {attempt + 1}): {e}"
+                )
+                batch = _unwritten(batch, e)
+        if batch:
+            logging.error(f"Giving up on persisting {len(batch)} messages")
+            ERRORS.labels("persist_messages").inc(len(batch))
+
+    def close(self, timeout=10):
+        """Flush everything still buffered and stop the writer thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+def _unwritten(batch, error):
+    """Documents of `batch` that a failed insert_many did not store"""
+    details = getattr(error, "details", None)
+    if not isinstance(details, dict) or "writeErrors" not in details:
+        # Not a BulkWriteError (e.g. the connection failed): retry it all;
+        # documents that did get stored come back as duplicate keys
+        return batch
+    return [
+        batch[write_error["index"]]
+        for write_error in details["writeErrors"]
+        if write_error.get("code") != DUPLICATE_KEY
+    ]
+
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITE_FLUSH_INTERVAL,
+    max_queue=settings.MESSAGE_WRITE_MAX_QUEUE,
+)
+
+
+def message_document(room_id, sender, message, message_id=None):
+    return {
+        "room_id": room_id,
+        "message_id": message_id or new_message_id(),
+        "sender": sender,
+        "message": message,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
@@ -0,0 +1,136 @@
+"""LLM providers, configured from settings
+
+LLM_PROVIDER / LLM_MODEL pick the primary chat model and LLM_FALLBACK_PROVIDER
+/ LLM_FALLBACK_MODEL an optional faster one. Both are wrapped in
+llm_models.ResilientChatModel, which adds the per-call deadline, hedged
+retries and the circuit breaker, so the room chains keep seeing a single
+LangChain chat model. Provider SDKs are imported only when a model is built.
+"""
+
+import threading
+import time
+from django.conf import settings
+from .metrics import LLM_EVENTS
+
+_providers = {}
+
+
+class LLMUnavailable(Exception):
+    """Neither the primary nor the fallback model answered in time"""
+
+
+def provider(name):
+    """Decorator registering the builder of provider `name`"""
+
+    def decorator(builder):
+        _providers[name] = builder
+        return builder
+
+    return decorator
+
+
+def build_model(name, model):
+    try:
+        builder = _providers[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider {name!r}") from None
+    return builder(model)
+
+
+@provider("gemini")
+def build_gemini(model):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Retries are ours (see ResilientChatModel); the SDK's own retry loop
+    # would otherwise outlive any deadline
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=settings.GOOGLE_API_KEY,
+        timeout=settings.LLM_TIMEOUT,
+        max_retries=0,
+    )
+
+
+@provider("stub")
+def build_stub(model):
+    from .llm_models import StubChatModel
+
+    return StubChatModel(model=model or "stub", latency=settings.LLM_STUB_LATENCY)
+
+
+class CircuitBreaker:
+    """Stop calling a model after `threshold` consecutive failures
+
+    Once open, calls are refused for `cooldown` seconds; after that a single
+    trial call is let through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until a trial call is let through; 0 while closed"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def abandon(self):
+        """A call ended without an outcome (e.g. it was cancelled)
+
+        Frees the trial slot so the next call can probe again.
+        """
+        with self._lock:
+            self.probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or (
+                self.opened_at is None and self.failures >= self.threshold
+            ):
+                LLM_EVENTS.labels("circuit_open").inc()
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+def build_llm():
+    """The chat model every room chain uses (services "llm")"""
+    from .llm_models import ResilientChatModel
+
+    fallback = None
+    if settings.LLM_FALLBACK_PROVIDER:
+        fallback = build_model(
+            settings.LLM_FALLBACK_PROVIDER, settings.LLM_FALLBACK_MODEL
+        )
+    return ResilientChatModel(
+        primary=build_model(settings.LLM_PROVIDER, settings.LLM_MODEL),
+        fallback=fallback,
+        timeout=settings.LLM_TIMEOUT,
+        fallback_reserve=settings.LLM_FALLBACK_RESERVE,
+        hedge_delay=settings.LLM_HEDGE_DELAY,
+        max_attempts=settings.LLM_MAX_ATTEMPTS,
+        breaker=CircuitBreaker(
+            settings.LLM_BREAKER_THRESHOLD, settings.LLM_BREAKER_COOLDOWN
+        ),
+    )
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from .metrics import RATE_LIMITED
+from .state import KEY_PREFIX, RedisRoomState, room_state
+
+# Token buckets for every key in KEYS, checked and charged together: either
+# all of them have `cost` tokens and are charged, or none is touched.
+# ARGV: cost, then burst and refill rate (tokens/s) for each key in turn.
+# Returns 0 when allowed, otherwise the milliseconds until it would be.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local burst = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    levels[i] = math.min(burst, tokens + elapsed * rate)
+    if levels[i] < cost then
+        wait = math.max(wait, (cost - levels[i]) / rate)
+    end
+end
+if wait > 0 then
+    return math.ceil(wait * 1000)
+end
+for i, key in ipairs(KEYS) do
+    local burst = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return 0
+"""
+
+# Local buckets are pruned of idle (full) entries past this many keys
+MAX_LOCAL_BUCKETS = 10000
+
+
+def bucket_key(kind, scope, name):
+    return f"{KEY_PREFIX}:ratelimit:{kind}:{scope}:{name}"
+
+
+def client_address(request):
+    """The address an HTTP request's "user" bucket is keyed on
+
+    Usernames are whatever the client sends, so they cannot identify who to
+    throttle.
+    """
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def buckets(kind, client, room_id):
+    """(key, burst, rate) for the per-user and per-room limits of `kind`
+
+    `client` identifies the sender: a socket's channel name, or the client
+    address of an HTTP request.
+    """
+    limits = settings.RATE_LIMITS[kind]
+    return [
+        (bucket_key(kind, "user", client), *limits["user"]),
+        (bucket_key(kind, "room", room_id), *limits["room"]),
+    ]
+
+
+class LocalRateLimiter:
+    """Token buckets held in process memory (single worker / development)"""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, last refill, seconds to refill)
+        self._lock = threading.Lock()
+
+    def _take(self, specs, cost):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0
+            for key, burst, rate in specs:
+                tokens, last, _ = self._buckets.get(key, (burst, now, 0))
+                level = min(burst, tokens + (now - last) * rate)
+                levels.append(level)
+                if level < cost:
+                    wait = max(wait, (cost - level) / rate)
+            if wait:
+                return wait
+            for (key, burst, rate), level in zip(specs, levels):
+                self._buckets[key] = (level - cost, now, burst / rate)
+            if len(self._buckets) > MAX_LOCAL_BUCKETS:
+                # Buckets idle long enough to be full again carry no state
+                self._buckets = {
+                    key: entry
+                    for key, entry in self._buckets.items()
+                    if now - entry[1] < entry[2]
+                }
+            return 0
+
+    def take(self, specs, cost=1):
+        return self._take(specs, cost)
+
+    async def atake(self, specs, cost=1):
+        return self._take(specs, cost)
+
+
+class RedisRateLimiter:
+    """Token buckets shared by every worker, one script call per check"""
+
+    def __init__(self, state):
+        self.state = state
+        self._script = state.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @staticmethod
+    def _args(specs, cost):
+        keys = [key for key, _, _ in specs]
+        args = [cost]
+        for _, burst, rate in specs:
+            args += [burst, rate]
+        return keys, args
+
+    def take(self, specs, cost=1):
+        keys, args = self._args(specs, cost)
+        return int(self._script(keys=keys, args=args)) / 1000
+
+    async def atake(self, specs, cost=1):
+        keys, args = self._args(specs, cost)
+        client = self.state.async_client()
+        return (
+            int(await client.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)) / 1000
+        )
+
+
+def _retry_after(kind, wait):
+    if wait:
+        RATE_LIMITED.labels(kind).inc()
+    return wait
+
+
+def check(kind, client, room_id):
+    """Charge one `kind` request to the client and the room
+
+    Returns 0 when allowed, otherwise the seconds until it would be. If the
+    limiter itself fails (e.g. Redis is unreachable) the request is allowed.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    try:
+        wait = rate_limiter.take(buckets(kind, client, room_id))
+    except Exception as e:
+        logging.warning(f"Rate limit check failed, allowing request: {e}")
+        return 0
+    return _retry_after(kind, wait)
+
+
+async def acheck(kind, client, room_id):
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    try:
+        wait = await rate_limiter.atake(buckets(kind, client, room_id))
+    except Exception as e:
+        logging.warning(f"Rate limit check failed, allowing request: {e}")
+        return 0
+    return _retry_after(kind, wait)
+
+
+if isinstance(room_state, RedisRoomState):
+    rate_limiter = RedisRateLimiter(room_state)
+else:
+    rate_limiter = LocalRateLimiter()
@@ -0,0 +1,127 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+EMBEDDING_DIM = 512
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _bucket(feature):
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % EMBEDDING_DIM
+
+
+def embed(normalized):
+    """Local hashed bag-of-words/bigram embedding, L2-normalised"""
+    import numpy as np
+
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = normalized.split()
+    for word in words:
+        vector[_bucket(word)] += 1.0
+    for first, second in zip(words, words[1:]):
+        vector[_bucket(f"{first} {second}")] += 0.5
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """Bounded TTL cache of AI replies keyed on normalised prompt text
+
+    Lookups try the exact normalised text first, then the most similar
+    cached prompt whose cosine similarity reaches `threshold`.
+    """
+
+    def __init__(self, max_entries, ttl, threshold):
+        # numpy is only imported when the cache is enabled
+        import numpy as np
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # key -> (response, slot, stored_at)
+        self._vectors = np.zeros((max_entries, EMBEDDING_DIM), dtype=np.float32)
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, prompt):
+        key = normalize(prompt)
+        if not key:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry[0]
+
+            scores = self._vectors @ embed(key)
+            while True:
+                slot = int(scores.argmax())
+                if scores[slot] < self.threshold:
+                    break
+                match = self._slot_keys[slot]
+                response, _, stored_at = self._entries[match]
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(match)
+                    self.stats["semantic_hits"] += 1
+                    return response
+                self._remove(match)
+                scores[slot] = 0
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, prompt, response):
+        key = normalize(prompt)
+        if not key:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while not self._free_slots:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+            slot = self._free_slots.pop()
+            self._vectors[slot] = embed(key)
+            self._slot_keys[slot] = key
+            self._entries[key] = (response, slot, time.monotonic())
+
+    def _remove(self, key):
+        _, slot, _ = self._entries.pop(key)
+        self._vectors[slot] = 0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+
+response_cache = (
+    ResponseCache(
+        max_entries=settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=settings.AI_RESPONSE_CACHE_TTL,
+        threshold=settings.AI_RESPONSE_CACHE_SIMILARITY,
+    )
+    if settings.AI_RESPONSE_CACHE_ENABLED
+    else None
+)
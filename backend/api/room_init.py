@@ -0,0 +1,148 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from django.conf import settings
+from .conversations import get_room_chain
+from .db import get_db
+from .metrics import ERRORS, MONGO_SECONDS
+
+_STOP = object()
+
+
+class RoomInitializer:
+    """Bounded background initialisation for newly created rooms
+
+    A fixed pool of `workers` threads drains a queue of at most `max_queue`
+    rooms. Each worker stores the `rooms` documents it has collected with one
+    insert_many (up to `batch_size` per batch, waiting no longer than
+    `flush_interval`), then warms each room's conversation chain. When the
+    queue is full, submit() refuses the room so the caller can push back.
+    """
+
+    def __init__(self, workers, batch_size, flush_interval, max_queue):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._status = OrderedDict()  # room_id -> status, most recent last
+        self._status_lock = threading.Lock()
+        self.max_tracked = max_queue * 10
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(
+                        target=self._run, name=f"room-init-{index}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+                atexit.register(self.close)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def status(self, room_id):
+        with self._status_lock:
+            return self._status.get(room_id)
+
+    def _set_status(self, room_id, status):
+        with self._status_lock:
+            self._status[room_id] = status
+            self._status.move_to_end(room_id)
+            while len(self._status) > self.max_tracked:
+                self._status.popitem(last=False)
+
+    def submit(self, room_id, room_name, max_participants):
+        """Queue a room for initialisation; False when the queue is full"""
+        self._ensure_started()
+        document = {
+            "room_id": room_id,
+            "name": room_name,
+            "created_at": datetime.utcnow().isoformat(),
+            "participants": 0,
+            "max_participants": max_participants,
+            "active": True,
+        }
+        # Marked before queueing so a fast worker's "ready" is not overwritten
+        self._set_status(room_id, "queued")
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            with self._status_lock:
+                self._status.pop(room_id, None)
+            return False
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._initialize(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or (
+                batch and time.monotonic() >= deadline
+            ):
+                self._initialize(batch)
+                batch = []
+                deadline = None
+
+    def _initialize(self, batch):
+        if not batch:
+            return
+        stored = True
+        try:
+            with MONGO_SECONDS.labels("insert_rooms").time():
+                get_db()["rooms"].insert_many(batch, ordered=False)
+        except Exception:
+            logging.exception(f"Failed to store {len(batch)} rooms")
+            ERRORS.labels("initialize_room_resources").inc()
+            stored = False
+
+        for document in batch:
+            room_id = document["room_id"]
+            try:
+                get_room_chain(room_id)
+            except Exception:
+                logging.exception(f"Error initialising room {room_id}")
+                ERRORS.labels("initialize_room_resources").inc()
+                self._set_status(room_id, "failed")
+            else:
+                self._set_status(room_id, "ready" if stored else "failed")
+
+    def close(self, timeout=10):
+        """Initialise everything still queued, then stop the workers"""
+        threads = [thread for thread in self._threads if thread.is_alive()]
+        for _ in threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+
+room_initializer = RoomInitializer(
+    workers=settings.ROOM_INIT_WORKERS,
+    batch_size=settings.ROOM_INIT_BATCH_SIZE,
+    flush_interval=settings.ROOM_INIT_FLUSH_INTERVAL,
+    max_queue=settings.ROOM_INIT_MAX_QUEUE,
+)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from django.conf import settings
+
+
+class RoomScheduler:
+    """Runs AI turns one room at a time, with a global cap on concurrent turns
+
+    Requests for a room that arrive while a turn is running wait in the
+    room's queue. With `coalesce` they are then handled together as a single
+    turn and every caller receives the same reply, except that a request
+    with a stream_id (a job id handed to its caller) always gets a turn of
+    its own, since the reply streams under that id. `after`, when set, runs
+    once the callers have their reply and before the room's next turn; its
+    failures are only logged.
+    """
+
+    def __init__(self, handler, max_concurrency, coalesce, after=None):
+        self.handler = handler
+        self.coalesce = coalesce
+        self.after = after
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending = {}  # room_id -> [(request, future)]
+        self._drains = {}  # room_id -> task
+
+    async def enqueue(self, room_id, request):
+        """Queue a request and return the future for its reply without waiting"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(room_id, []).append((request, future))
+        if room_id not in self._drains:
+            self._drains[room_id] = asyncio.create_task(self._drain(room_id))
+        return future
+
+    async def submit(self, room_id, request):
+        """Queue a request and wait for the AI reply"""
+        return await (await self.enqueue(room_id, request))
+
+    def queued(self, room_id):
+        return len(self._pending.get(room_id, ()))
+
+    async def _drain(self, room_id):
+        try:
+            while self._pending.get(room_id):
+                batch = self._next_batch(self._pending[room_id])
+
+                try:
+                    async with self._slots:
+                        result = await self.handler(
+                            room_id, [request for request, _ in batch]
+                        )
+                except BaseException as e:
+                    # Cancellation (shutdown, async_to_sync tearing down its
+                    # loop) must still release callers waiting on the batch
+                    interrupted = not isinstance(e, Exception)
+                    _fail(batch, _interrupted() if interrupted else e)
+                    if interrupted:
+                        raise
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(result)
+                    if self.after is not None:
+                        await self._run_after(room_id)
+        finally:
+            _fail(self._pending.pop(room_id, ()), _interrupted())
+            self._drains.pop(room_id, None)
+
+    def _next_batch(self, queue):
+        size = 1
+        if self.coalesce and not _has_stream_id(queue[0]):
+            while size < len(queue) and not _has_stream_id(queue[size]):
+                size += 1
+        batch = queue[:size]
+        del queue[:size]
+        return batch
+
+    async def _run_after(self, room_id):
+        try:
+            async with self._slots:
+                await self.after(room_id)
+        except Exception:
+            logging.exception(f"After-turn work failed for room {room_id}")
+
+
+def _has_stream_id(entry):
+    request, _ = entry
+    return bool(getattr(request, "stream_id", None))
+
+
+def _interrupted():
+    return RuntimeError("AI turn interrupted")
+
+
+def _fail(batch, error):
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+def log_failure(future):
+    """Done-callback for replies nobody awaits (streamed turns)"""
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"AI turn failed: {future.exception()}")
+
+
+def build_scheduler(handler, after=None):
+    return RoomScheduler(
+        handler,
+        max_concurrency=settings.AI_MAX_CONCURRENT_TURNS,
+        coalesce=settings.AI_COALESCE_MESSAGES,
+        after=after,
+    )
@@ -0,0 +1,121 @@
+import re
+from django.conf import settings
+from .db import DESCENDING, get_async_db, get_db
+from .metrics import MONGO_SECONDS, timed
+
+SORTS = ("relevance", "recent")
+
+# Rough English suffix stripping so "running" in a query still highlights
+# "run" and "runs", mirroring the stemming of the Mongo text index
+SUFFIXES = ("ing", "ed", "s")
+
+PHRASE = re.compile(r'"([^"]+)"')
+TERM = re.compile(r"(-?)(\w+)")
+
+
+def search_params(params):
+    """Parse q/limit/offset/sort query parameters"""
+    query = params.get("q", "").strip()
+    if not query:
+        raise ValueError("'q' is required")
+    limit = int(params.get("limit") or settings.SEARCH_PAGE_SIZE)
+    offset = int(params.get("offset") or 0)
+    if limit < 1 or offset < 0:
+        raise ValueError("'limit' must be positive and 'offset' non-negative")
+    if offset >= settings.SEARCH_MAX_OFFSET:
+        raise ValueError(f"'offset' must be below {settings.SEARCH_MAX_OFFSET}")
+    sort = params.get("sort", "relevance")
+    if sort not in SORTS:
+        raise ValueError(f"'sort' must be one of {', '.join(SORTS)}")
+    return {
+        "query": query,
+        "limit": min(limit, settings.SEARCH_MAX_PAGE_SIZE),
+        "offset": offset,
+        "sort": sort,
+    }
+
+
+def _stem(term):
+    for suffix in SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            term = term[: -len(suffix)]
+            # "running" -> "runn" -> "run"
+            if len(term) > 3 and term[-1] == term[-2] and term[-1] not in "aeiou":
+                term = term[:-1]
+            break
+    return term
+
+
+def highlight_pattern(query):
+    """Regex matching the phrases and (stemmed) terms a $text query looks for"""
+    phrases = PHRASE.findall(query)
+    terms = [
+        term for negated, term in TERM.findall(PHRASE.sub(" ", query)) if not negated
+    ]
+    parts = [re.escape(phrase) for phrase in phrases]
+    parts += [rf"\b{re.escape(_stem(term.lower()))}\w*" for term in terms]
+    if not parts:
+        return None
+    # Longest first so a phrase wins over the words inside it
+    parts.sort(key=len, reverse=True)
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+def highlights(text, pattern):
+    """[start, end) character ranges of the matches in `text`"""
+    if pattern is None:
+        return []
+    return [[match.start(), match.end()] for match in pattern.finditer(text)]
+
+
+def _find_args(room_id, query, sort):
+    # The text index is prefixed with room_id, so the equality on room_id
+    # keeps every search within one room's entries
+    filter = {"room_id": room_id, "$text": {"$search": query}}
+    projection = {"_id": 0, "score": {"$meta": "textScore"}}
+    if sort == "recent":
+        order = [("timestamp", DESCENDING)]
+    else:
+        order = [("score", {"$meta": "textScore"}), ("timestamp", DESCENDING)]
+    return filter, projection, order
+
+
+def _build_results(documents, query, limit, offset):
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    pattern = highlight_pattern(query)
+    for document in documents:
+        document["highlights"] = highlights(document.get("message", ""), pattern)
+    return {
+        "results": documents,
+        "has_more": has_more,
+        "next_offset": offset + limit if has_more else None,
+    }
+
+
+@timed(MONGO_SECONDS, "search")
+def search_messages(room_id, query, limit, offset=0, sort="relevance"):
+    """One page of a room's messages matching `query`, best (or newest) first"""
+    filter, projection, order = _find_args(room_id, query, sort)
+    cursor = (
+        get_db()["messages"]
+        .find(filter, projection)
+        .sort(order)
+        .skip(offset)
+        .limit(limit + 1)
+    )
+    return _build_results(list(cursor), query, limit, offset)
+
+
+@timed(MONGO_SECONDS, "search")
+async def asearch_messages(room_id, query, limit, offset=0, sort="relevance"):
+    filter, projection, order = _find_args(room_id, query, sort)
+    cursor = (
+        get_async_db()["messages"]
+        .find(filter, projection)
+        .sort(order)
+        .skip(offset)
+        .limit(limit + 1)
+    )
+    documents = await cursor.to_list(length=limit + 1)
+    return _build_results(documents, query, limit, offset)
@@ -1,5 +1,4 @@
-import pickle
-from backend.api.models import Room, RoomMember
+from .codec import decode, encode_member, encode_message, encode_room
 
 
 class RoomSerializer:
@@ -10,10 +9,10 @@ class RoomSerializer:
             "created_at": obj.created_at,
             "member_count": obj.members.count(),
         }
-        return pickle.dumps(data)
+        return encode_room(data)
 
     def deserialize(self, data):
-        return pickle.loads(data)
+        return decode(data)
 
 
 class RoomMemberSerializer:
@@ -25,31 +24,24 @@ class RoomMemberSerializer:
             "is_active_speaker": obj.is_active_speaker,
             "joined_at": obj.joined_at,
         }
-        return pickle.dumps(data)
+        return encode_member(data)
 
     def deserialize(self, data):
-        return pickle.loads(data)
+        return decode(data)
 
 
-# from rest_framework import serializers
+class MessageSerializer:
+    """Chat message documents as stored in the messages collection"""
 
-# from backend.api.models import *
-
-
-# class RoomSerializer(serializers.ModelSerializer):
-#     member_count = serializers.SerializerMethodField()
-
-#     class Meta:
-#         model = Room
-#         fields = ["id", "name", "created_at", "member_count"]
-
-#     def get_member_count(self, obj):
-#         return obj.members.count()
-
-
-# class RoomMemberSerializer(serializers.ModelSerializer):
-#     username = serializers.CharField(source="user.username", read_only=True)
+    def serialize(self, document):
+        data = {
+            "room_id": document["room_id"],
+            "message_id": document.get("message_id"),
+            "sender": document["sender"],
+            "message": document["message"],
+            "timestamp": document["timestamp"],
+        }
+        return encode_message(data)
 
-#     class Meta:
-#         model = RoomMember
-#         fields = ["id", "room", "username", "is_active_speaker", "joined_at"]
+    def deserialize(self, data):
+        return decode(data)
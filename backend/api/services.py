@@ -0,0 +1,61 @@
+"""Process-wide clients, built on first use instead of at import time
+
+Heavy clients (the chat model from api.providers, the MongoDB client) are registered
+here as factories, so importing api.views, running a management command or
+starting Daphne does not pay for SDK imports or client construction until a
+request actually needs them.
+"""
+
+import threading
+from django.conf import settings
+
+_factories = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name):
+    """Decorator registering the factory that builds service `name`"""
+
+    def decorator(factory):
+        _factories[name] = factory
+        return factory
+
+    return decorator
+
+
+def get(name):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = _factories[name]()
+    return instance
+
+
+def override(name, instance):
+    """Use `instance` for service `name` (benchmarks, local stubs)"""
+    with _lock:
+        _instances[name] = instance
+
+
+def reset(name):
+    """Forget a built instance so the next get() builds a fresh one"""
+    with _lock:
+        _instances.pop(name, None)
+
+
+@register("llm")
+def build_llm():
+    from .providers import build_llm
+
+    return build_llm()
+
+
+@register("mongo")
+def build_mongo():
+    from pymongo import MongoClient
+    from .db import client_options
+
+    return MongoClient(settings.MONGO_URI, **client_options())
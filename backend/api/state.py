@@ -0,0 +1,368 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from .db import afind_room, find_room
+
+KEY_PREFIX = "convoroom"
+
+# Participants hold a slot in a sorted set scored by when their presence
+# expires. Every script first drops expired slots, so a worker that died
+# without running disconnect() cannot keep a room full for longer than
+# ROOM_PRESENCE_TTL.
+
+# Admit (or refresh) a member. ARGV: member, presence ttl, room ttl.
+# Returns 1 when admitted, 0 when full and -1 when the room does not exist.
+ADMIT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+local max_participants = tonumber(redis.call('HGET', KEYS[1], 'max_participants') or '0')
+if not redis.call('ZSCORE', KEYS[2], ARGV[1])
+        and redis.call('ZCARD', KEYS[2]) >= max_participants then
+    return 0
+end
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('HSET', KEYS[1], 'participants', redis.call('ZCARD', KEYS[2]))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Release a member's slot. ARGV: member.
+LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'participants', redis.call('ZCARD', KEYS[2]))
+end
+return 1
+"""
+
+# Whether a room has a free slot, without taking it.
+# Returns 1 when open, 0 when full and -1 when the room does not exist.
+STATUS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+local max_participants = tonumber(redis.call('HGET', KEYS[1], 'max_participants') or '0')
+if redis.call('ZCARD', KEYS[2]) >= max_participants then
+    return 0
+end
+return 1
+"""
+
+# Store a memory snapshot, but only over the version it was built from.
+# ARGV: expected version (0 when there is none yet), snapshot, ttl.
+# Returns the new version, or -1 when another worker saved first.
+SAVE_MEMORY_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+local version = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return version
+"""
+
+ADMIT_RESULTS = {1: "joined", 0: "full", -1: "missing"}
+STATUS_RESULTS = {1: "open", 0: "full", -1: "missing"}
+
+
+class MemoryConflict(Exception):
+    """A room's memory was saved by someone else since it was loaded"""
+
+
+def room_key(room_id):
+    return f"{KEY_PREFIX}:room:{room_id}"
+
+
+def presence_key(room_id):
+    return f"{KEY_PREFIX}:room:{room_id}:presence"
+
+
+def memory_key(room_id):
+    return f"{KEY_PREFIX}:room:{room_id}:memory"
+
+
+def memory_version_key(room_id):
+    return f"{KEY_PREFIX}:room:{room_id}:memory_version"
+
+
+class LocalRoomState:
+    """In-process room state; only correct with a single worker process"""
+
+    def __init__(self, presence_ttl):
+        self.presence_ttl = presence_ttl
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def create_room(self, room_id, max_participants):
+        with self._lock:
+            self._rooms[room_id] = {
+                "max_participants": max_participants,
+                "members": {},  # member -> presence expiry (monotonic)
+            }
+
+    def restore_room(self, room_id, max_participants):
+        with self._lock:
+            self._rooms.setdefault(
+                room_id, {"max_participants": max_participants, "members": {}}
+            )
+
+    def _live_members(self, room):
+        now = time.monotonic()
+        members = room["members"]
+        for member in [m for m, expires in members.items() if expires <= now]:
+            del members[member]
+        return members
+
+    def room_status(self, room_id):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return "missing"
+            if len(self._live_members(room)) >= room["max_participants"]:
+                return "full"
+            return "open"
+
+    def admit(self, room_id, member):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return "missing"
+            members = self._live_members(room)
+            if member not in members and len(members) >= room["max_participants"]:
+                return "full"
+            members[member] = time.monotonic() + self.presence_ttl
+            return "joined"
+
+    def leave(self, room_id, member):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None:
+                room["members"].pop(member, None)
+
+    def memory_version(self, room_id):
+        return None
+
+    def load_memory(self, room_id):
+        return None
+
+    def save_memory(self, room_id, snapshot, version):
+        return None
+
+    async def acreate_room(self, room_id, max_participants):
+        self.create_room(room_id, max_participants)
+
+    async def arestore_room(self, room_id, max_participants):
+        self.restore_room(room_id, max_participants)
+
+    async def aadmit(self, room_id, member):
+        return self.admit(room_id, member)
+
+    async def aleave(self, room_id, member):
+        self.leave(room_id, member)
+
+    async def amemory_version(self, room_id):
+        return None
+
+    async def aload_memory(self, room_id):
+        return None
+
+    async def asave_memory(self, room_id, snapshot, version):
+        return None
+
+
+class RedisRoomState:
+    """Room state shared by every worker through Redis
+
+    Participant slots live in a per-room sorted set (see ADMIT_SCRIPT), so
+    admission is a single atomic script call from any worker. Conversation
+    memory is stored as a JSON snapshot next to a version counter, so a worker
+    can tell cheaply whether its cached chain is stale, and a save made from a
+    stale chain is refused (see SAVE_MEMORY_SCRIPT).
+    """
+
+    def __init__(self, url, ttl, presence_ttl):
+        self.url = url
+        self.ttl = ttl
+        self.presence_ttl = presence_ttl
+        self.client = redis.Redis.from_url(url)
+        self._status = self.client.register_script(STATUS_SCRIPT)
+        self._save_memory = self.client.register_script(SAVE_MEMORY_SCRIPT)
+        # redis.asyncio connections belong to the loop they were created on
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = aioredis.Redis.from_url(self.url)
+            self._async_clients[loop] = client
+        return client
+
+    def create_room(self, room_id, max_participants):
+        key = room_key(room_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(
+            key, mapping={"participants": 0, "max_participants": max_participants}
+        )
+        pipe.expire(key, self.ttl)
+        pipe.delete(presence_key(room_id))
+        pipe.execute()
+
+    def restore_room(self, room_id, max_participants):
+        """Recreate a room's entry, unless another worker already did
+
+        Unlike create_room, live presence slots are kept.
+        """
+        key = room_key(room_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hsetnx(key, "max_participants", max_participants)
+        pipe.hsetnx(key, "participants", 0)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def room_status(self, room_id):
+        keys = [room_key(room_id), presence_key(room_id)]
+        return STATUS_RESULTS[int(self._status(keys=keys))]
+
+    def memory_version(self, room_id):
+        version = self.client.get(memory_version_key(room_id))
+        return int(version) if version is not None else None
+
+    def load_memory(self, room_id):
+        """Return (version, snapshot) or None when the room has no stored memory"""
+        raw, version = self.client.mget(
+            memory_key(room_id), memory_version_key(room_id)
+        )
+        if raw is None:
+            return None
+        return int(version or 0), json.loads(raw)
+
+    def save_memory(self, room_id, snapshot, version):
+        """Store a snapshot built from `version` and return the new version
+
+        Raises MemoryConflict when the stored version is no longer `version`.
+        """
+        result = self._save_memory(
+            keys=[memory_key(room_id), memory_version_key(room_id)],
+            args=[version or 0, json.dumps(snapshot), self.ttl],
+        )
+        return _saved_version(result)
+
+    async def acreate_room(self, room_id, max_participants):
+        key = room_key(room_id)
+        async with self.async_client().pipeline(transaction=True) as pipe:
+            pipe.hset(
+                key,
+                mapping={"participants": 0, "max_participants": max_participants},
+            )
+            pipe.expire(key, self.ttl)
+            pipe.delete(presence_key(room_id))
+            await pipe.execute()
+
+    async def arestore_room(self, room_id, max_participants):
+        key = room_key(room_id)
+        async with self.async_client().pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, "max_participants", max_participants)
+            pipe.hsetnx(key, "participants", 0)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def aadmit(self, room_id, member):
+        """Take or refresh `member`'s slot: returns joined, full or missing"""
+        result = await self.async_client().eval(
+            ADMIT_SCRIPT,
+            2,
+            room_key(room_id),
+            presence_key(room_id),
+            member,
+            self.presence_ttl,
+            self.ttl,
+        )
+        return ADMIT_RESULTS[int(result)]
+
+    async def aleave(self, room_id, member):
+        await self.async_client().eval(
+            LEAVE_SCRIPT, 2, room_key(room_id), presence_key(room_id), member
+        )
+
+    async def amemory_version(self, room_id):
+        version = await self.async_client().get(memory_version_key(room_id))
+        return int(version) if version is not None else None
+
+    async def aload_memory(self, room_id):
+        raw, version = await self.async_client().mget(
+            memory_key(room_id), memory_version_key(room_id)
+        )
+        if raw is None:
+            return None
+        return int(version or 0), json.loads(raw)
+
+    async def asave_memory(self, room_id, snapshot, version):
+        result = await self.async_client().eval(
+            SAVE_MEMORY_SCRIPT,
+            2,
+            memory_key(room_id),
+            memory_version_key(room_id),
+            version or 0,
+            json.dumps(snapshot),
+            self.ttl,
+        )
+        return _saved_version(result)
+
+
+def _saved_version(result):
+    if int(result) < 0:
+        raise MemoryConflict()
+    return int(result)
+
+
+def recover_room(room_id):
+    """Recreate a "missing" room's entry from its Mongo `rooms` document
+
+    Entries expire after ROOM_STATE_TTL or go with a Redis flush, and rooms
+    created before the shared room state never had one, but Mongo still
+    knows them. Returns whether the room was found.
+    """
+    try:
+        room = find_room(room_id)
+    except Exception as e:
+        logging.warning(f"Could not look up room {room_id}: {e}")
+        return False
+    if room is None:
+        return False
+    room_state.restore_room(room_id, room["max_participants"])
+    return True
+
+
+async def arecover_room(room_id):
+    try:
+        room = await afind_room(room_id)
+    except Exception as e:
+        logging.warning(f"Could not look up room {room_id}: {e}")
+        return False
+    if room is None:
+        return False
+    await room_state.arestore_room(room_id, room["max_participants"])
+    return True
+
+
+if settings.ROOM_STATE_BACKEND == "redis":
+    room_state = RedisRoomState(
+        settings.REDIS_URL, settings.ROOM_STATE_TTL, settings.ROOM_PRESENCE_TTL
+    )
+else:
+    room_state = LocalRoomState(settings.ROOM_PRESENCE_TTL)
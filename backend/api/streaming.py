@@ -0,0 +1,74 @@
+import uuid
+from channels.layers import get_channel_layer
+from .metrics import group_send
+
+
+def new_message_id():
+    return uuid.uuid4().hex
+
+
+async def stream_reply(chain, room_id, inputs, message_id):
+    """Generate a reply with the room's chain and push it to the room chunk by chunk"""
+    channel_layer = get_channel_layer()
+    group_name = f"room_{room_id}"
+
+    inputs = chain.prep_inputs(inputs)
+    prompt_value = chain.prompt.format_prompt(
+        **{k: v for k, v in inputs.items() if k in chain.prompt.input_variables}
+    )
+
+    parts = []
+    seq = 0
+    try:
+        async for chunk in chain.llm.astream(prompt_value):
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if not text:
+                continue
+            parts.append(text)
+            await group_send(
+                channel_layer,
+                group_name,
+                {
+                    "type": "chat_message",
+                    "event": "chunk",
+                    "message_id": message_id,
+                    "seq": seq,
+                    "delta": text,
+                    "username": "AI",
+                },
+            )
+            seq += 1
+    except Exception as e:
+        await group_send(
+            channel_layer,
+            group_name,
+            {
+                "type": "chat_message",
+                "event": "error",
+                "message_id": message_id,
+                "seq": seq,
+                "error": str(e),
+                "username": "AI",
+            },
+        )
+        raise
+
+    ai_response = "".join(parts)
+    # Keep the conversation memory in step with the non-streaming path
+    outputs = {chain.output_key: ai_response}
+    if chain.memory is not None:
+        await chain.memory.asave_context(inputs, outputs)
+
+    await group_send(
+        channel_layer,
+        group_name,
+        {
+            "type": "chat_message",
+            "event": "done",
+            "message_id": message_id,
+            "seq": seq,
+            "message": ai_response,
+            "username": "AI",
+        },
+    )
+    return ai_response
@@ -1,36 +1,34 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+import hmac
 import json
-import os
+import logging
+import math
 import uuid
-from dotenv import load_dotenv
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
-from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from pymongo import MongoClient
-from datetime import datetime
-import threading
-
-load_dotenv()
-API_KEY = os.getenv("GOOGLE_API_KEY")
-
-chat = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=API_KEY)
-
-room_conversations = {}
-
-MONGO_URI = os.getenv("DATABASE_URL")
-if MONGO_URI is None:
-    raise ValueError("DATABASE_URL environment variable not set")
-
-
-client = MongoClient(MONGO_URI)
-db = client["convoroom"]
-messages_collection = db["messages"]
-# print("Rooms Collection:", messages_collection)
+from . import services
+from .archive import archive_lines, gzip_chunks, import_archive
+from .streaming import new_message_id
+from .db import get_db, history_page, iter_room_messages
+from .conversations import room_conversations
+from .state import recover_room, room_state
+from .providers import LLMUnavailable
+from .ratelimit import check as rate_limit_check, client_address
+from .search import search_messages, search_params
+from .ai import TurnRequest, ai_scheduler, plain_message, start_turn
+from .metrics import (
+    CACHED_ROOMS,
+    ERRORS,
+    PENDING_ROOM_INITS,
+    RESPONSE_CACHE_EVENTS,
+)
+from .room_init import room_initializer
+from .response_cache import response_cache
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 
 @api_view(["POST"])
@@ -44,74 +42,157 @@ def getReactData(request):
         if not user_message or not room_id:
             return Response({"error": "Invalid request"}, status=400)
 
-        if room_id not in room_conversations:
-            memory = ConversationBufferMemory(return_messages=True)
-            room_conversations[room_id] = ConversationChain(
-                llm=chat, memory=memory, verbose=False
-            )
+        wait = rate_limit_check("ai", client_address(request), room_id)
+        if wait:
+            return rate_limited(Response, wait)
+
+        turn = TurnRequest(
+            username=username,
+            message=plain_message(username, user_message),
+            user_persisted=bool(data.get("sentOverSocket")),
+            message_id=data.get("messageId"),
+        )
 
-            room_conversations[room_id].predict(
-                input=(
-                    os.getenv(
-                        "Prompt",
-                        "Welcome to the chat room! How can I assist you today?",
-                    )
-                )
+        if data.get("stream"):
+            turn.stream_id = new_message_id()
+            async_to_sync(start_turn)(room_id, turn)
+            return Response(
+                {"jobId": turn.stream_id, "messageId": turn.stream_id, "stream": True},
+                status=202,
             )
 
-        room_chat_history = list(
-            messages_collection.find({"room_id": room_id}, {"_id": 0}).sort("timestamp")
-        )[-5:]
+        # Turns are serialised per room on the event loop (see api.scheduler)
+        ai_response = async_to_sync(ai_scheduler.submit)(room_id, turn)
 
-        context = ""
-        for msg in room_chat_history:
-            context += f"{msg['sender']}: {msg['message']}\n"
+        return Response({"response": ai_response}, status=200)
 
-        ai_response = room_conversations[room_id].predict(
-            input=f"Previous messages in this room:\n{context}\n\nUser's new message: {user_message}"
-        )
+    except LLMUnavailable as e:
+        logging.warning(f"getReactData: {e}")
+        return ai_unavailable(Response)
+    except Exception as e:
+        logging.exception("getReactData failed")
+        ERRORS.labels("getReactData").inc()
+        return Response({"error": str(e)}, status=500)
 
-        collection = db["messages"]
 
-        collection.insert_one(
-            {
-                "room_id": room_id,
-                "sender": username,
-                "message": user_message,
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-        )
+def history_params(params):
+    """Parse before/after/limit query parameters; None when not paginating"""
+    before = params.get("before")
+    after = params.get("after")
+    limit = params.get("limit")
+    if before is None and after is None and limit is None:
+        return None
+    if before and after:
+        raise ValueError("Use either 'before' or 'after', not both")
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("'limit' must be a positive integer")
+    return {"before": before, "after": after, "limit": limit}
 
-        collection.insert_one(
-            {
-                "room_id": room_id,
-                "sender": "AI",
-                "message": ai_response,
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-        )
 
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"room_{room_id}",
-            {"type": "chat_message", "message": ai_response, "username": "AI"},
+@api_view(["GET"])
+def get_chat_history(request, room_id):
+    try:
+        page = history_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if page is not None:
+            return JsonResponse(history_page(room_id, **page))
+
+        chat_history = list(
+            get_db()["messages"]
+            .find({"room_id": room_id}, {"_id": 0})
+            .sort("timestamp")
         )
+        return JsonResponse({"messages": chat_history}, safe=False)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-        return Response({"response": ai_response}, status=200)
 
+@api_view(["GET"])
+def search_room(request, room_id):
+    """Full-text search within one room, ranked by relevance or recency"""
+    try:
+        params = search_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        return JsonResponse(search_messages(room_id, **params))
     except Exception as e:
-        return Response({"error": str(e)}, status=500)
+        logging.exception("search_room failed")
+        ERRORS.labels("search_room").inc()
+        return JsonResponse({"error": str(e)}, status=500)
 
 
 @api_view(["GET"])
-def get_chat_history(request, room_id):
+def stream_chat_history(request, room_id):
+    """Stream a room's history as NDJSON, one message per line, oldest first"""
+    after = request.GET.get("after")
     try:
-        chat_history = list(
-            messages_collection.find({"room_id": room_id}, {"_id": 0}).sort("timestamp")
+        messages = iter_room_messages(room_id, after=after)
+        # Surface a malformed cursor as a 400 before the response starts
+        first = next(messages, None)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    def lines():
+        if first is None:
+            return
+        yield json.dumps(first, default=str) + "\n"
+        for message in messages:
+            yield json.dumps(message, default=str) + "\n"
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+def metrics(request):
+    """Prometheus scrape endpoint"""
+    CACHED_ROOMS.set(len(room_conversations))
+    PENDING_ROOM_INITS.set(room_initializer.pending())
+    if response_cache is not None:
+        for event, count in response_cache.stats.items():
+            RESPONSE_CACHE_EVENTS.labels(event).set(count)
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
+@api_view(["GET"])
+def export_room(request, room_id):
+    """Download a room's history as a gzip-compressed NDJSON archive"""
+    response = StreamingHttpResponse(
+        gzip_chunks(archive_lines(room_id)), content_type="application/gzip"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{room_id}.ndjson.gz"'
+    return response
+
+
+@csrf_exempt
+def import_room(request):
+    """Restore an archive from the raw request body (admin only)"""
+    if request.method != "POST":
+        return JsonResponse(
+            {"detail": f'Method "{request.method}" not allowed.'}, status=405
         )
-        return JsonResponse({"messages": chat_history}, safe=False)
+    token = settings.ARCHIVE_IMPORT_TOKEN
+    supplied = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(supplied, f"Bearer {token}"):
+        return JsonResponse({"error": "Archive import is not allowed"}, status=403)
+
+    try:
+        # The request is read as a stream, so large archives never sit in memory
+        count = import_archive(request, request.GET.get("roomId"))
+    except (OSError, EOFError, ValueError) as e:
+        return JsonResponse({"error": f"Invalid archive: {e}"}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"imported": count})
 
 
 @api_view(["GET"])
@@ -119,70 +200,100 @@ def hello_world(request):
     return Response({"message": "Hello from Django!"})
 
 
-rooms = {}
+MAX_PARTICIPANTS = 4
+# Retry-After (seconds) for a failed AI call while the breaker is closed
+AI_UNAVAILABLE_RETRY_AFTER = 5
 
 
 @api_view(["POST"])
 def create_room(request):
     try:
         room_id = request.data.get("roomId", str(uuid.uuid4())[:8])
+        room_name = request.data.get("room_name", "New Room")
 
-        rooms[room_id] = {"participants": 0, "max_participants": 4}
+        # Non-critical initialisation runs on the bounded room_initializer
+        # pool; refuse new rooms while it is saturated
+        if not room_initializer.submit(room_id, room_name, MAX_PARTICIPANTS):
+            return room_creation_busy(Response)
+
+        room_state.create_room(room_id, MAX_PARTICIPANTS)
 
         response = {
             "success": True,
             "message": "Room created successfully",
             "roomId": room_id,
         }
-
-        # Start background task for non-critical operations
-
-        threading.Thread(
-            target=initialize_room_resources,
-            args=(room_id, request.data.get("room_name", "New Room")),
-        ).start()
-
         return Response(response)
     except Exception as e:
         return Response({"success": False, "error": str(e)}, status=500)
 
 
-def initialize_room_resources(room_id, room_name):
-    """Perform non-critical initialization tasks in background"""
-    try:
-        # Store in MongoDB asynchronously
-        room_data = {
-            "room_id": room_id,
-            "name": room_name,
-            "created_at": datetime.utcnow().isoformat(),
-            "participants": 0,
-            "max_participants": 4,
-            "active": True,
-        }
-        db["rooms"].insert_one(room_data)
+def room_creation_busy(response_class):
+    response = response_class(
+        {"success": False, "error": "Too many rooms being created, retry shortly"},
+        status=503,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def ai_unavailable(response_class):
+    # While the breaker is open nothing is tried before its cooldown ends;
+    # otherwise the call itself failed (e.g. timed out) and may succeed soon
+    breaker = getattr(services.get("llm"), "breaker", None)
+    wait = breaker.retry_after() if breaker is not None else 0
+    response = response_class(
+        {"error": "The AI is unavailable right now, try again shortly"}, status=503
+    )
+    response["Retry-After"] = str(math.ceil(wait) or AI_UNAVAILABLE_RETRY_AFTER)
+    return response
 
-        # Initialize AI conversation if needed
-        if room_id not in room_conversations:
-            memory = ConversationBufferMemory(return_messages=True)
-            room_conversations[room_id] = ConversationChain(
-                llm=chat, memory=memory, verbose=False
-            )
-    except Exception as e:
-        # TODO: Use proper logging instead of print
-        import logging
 
-        logging.error(f"Error in background initialization: {e}")
+def rate_limited(response_class, wait):
+    """429 telling the client how many seconds to back off"""
+    retry_after = max(1, math.ceil(wait))
+    response = response_class(
+        {"error": "Rate limit exceeded, retry shortly", "retryAfter": retry_after},
+        status=429,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def current_room_status(room_id):
+    """room_state.room_status, recovering rooms only Mongo still knows"""
+    status = room_state.room_status(room_id)
+    if status == "missing" and recover_room(room_id):
+        status = room_state.room_status(room_id)
+    return status
+
+
+@api_view(["GET"])
+def room_status(request, room_id):
+    """Initialisation progress and free-slot status of a room"""
+    initialization = room_initializer.status(room_id)
+    availability = current_room_status(room_id)
+    if initialization is None and availability == "missing":
+        return Response({"error": "Room not found or does not exist"}, status=404)
+    return Response(
+        {
+            "roomId": room_id,
+            "initialization": initialization or "unknown",
+            "availability": availability,
+            "pendingRooms": room_initializer.pending(),
+        }
+    )
 
 
 @api_view(["POST"])
 def join_room(request):
     room_id = request.data.get("roomId")
-    if room_id in rooms:
-        if rooms[room_id]["participants"] < rooms[room_id]["max_participants"]:
-            rooms[room_id]["participants"] += 1
-            return Response({"message": "Joined room successfully"})
-        else:
-            return Response({"error": "Room is full"}, status=403)
+    # Only checks for a free slot: the WebSocket connection takes it
+    result = current_room_status(room_id)
+    if result == "open":
+        return Response({"message": "Joined room successfully"})
+    elif result == "full":
+        return Response({"error": "Room is full"}, status=403)
     else:
         return Response({"error": "Room not found or does not exist"}, status=404)
 
@@ -190,7 +301,7 @@ def join_room(request):
 @api_view(["POST"])
 def insert_data(request):
     try:
-        collection = db["mycollection"]
+        collection = get_db()["mycollection"]
         data = {"message": "Hello MongoDB"}
         collection.insert_one(data)
         return JsonResponse({"status": "Data Inserted"})
@@ -79,6 +79,191 @@ REDIS_URL = os.environ.get("REDIS_URL") or os.environ.get(
     "redis_host", "redis://localhost:6379/0"
 )
 
+# Gemini API key, read when the chat model is first built (see api/services.py)
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Chat model (api/providers.py): "gemini" or the offline "stub", plus an
+# optional faster fallback model used when the primary fails, times out or
+# its circuit breaker is open (empty LLM_FALLBACK_PROVIDER disables it)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "gemini")
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "gemini-2.0-flash-lite")
+# Deadline in seconds for one AI call, hedges, retries and the fallback
+# included; the last LLM_FALLBACK_RESERVE seconds of it are kept for the
+# fallback model. A second request is raced against one still pending after
+# LLM_HEDGE_DELAY seconds (0 disables hedging); LLM_MAX_ATTEMPTS caps primary
+# requests per call
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", "5"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "6"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+# After LLM_BREAKER_THRESHOLD consecutive failures the primary is skipped for
+# LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Seconds the stub provider waits per call, to stand in for model latency
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0"))
+
+# MongoDB Configuration
+MONGO_URI = os.getenv("DATABASE_URL")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "convoroom")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+# Create the (room_id, timestamp) index on startup
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "True") == "True"
+# Number of recent room messages given to the AI as context
+RECENT_CONTEXT_MESSAGES = int(os.getenv("RECENT_CONTEXT_MESSAGES", "5"))
+# get_chat_history pagination and NDJSON streaming
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+HISTORY_STREAM_BATCH_SIZE = int(os.getenv("HISTORY_STREAM_BATCH_SIZE", "500"))
+# api/search/<room_id>/ page sizes; deep offsets are refused since every page
+# re-scans the skipped matches
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+# Most messages replayed to a reconnecting WebSocket; a longer gap (or an
+# unknown last-seen message) gets the newest SYNC_MAX_MESSAGES instead
+SYNC_MAX_MESSAGES = int(os.getenv("SYNC_MAX_MESSAGES", "200"))
+# Room archives (api/archive.py): messages per insert_many on import, and
+# the bearer token POST api/import_room/ requires (import over HTTP is off
+# when unset)
+ARCHIVE_IMPORT_BATCH_SIZE = int(os.getenv("ARCHIVE_IMPORT_BATCH_SIZE", "1000"))
+ARCHIVE_IMPORT_TOKEN = os.getenv("ARCHIVE_IMPORT_TOKEN")
+# Per-room ConversationChain cache; evicted rooms are rebuilt from the last
+# CONVERSATION_REHYDRATE_MESSAGES stored messages
+CONVERSATION_CACHE_MAX_ROOMS = int(os.getenv("CONVERSATION_CACHE_MAX_ROOMS", "1000"))
+CONVERSATION_IDLE_TIMEOUT = int(os.getenv("CONVERSATION_IDLE_TIMEOUT", "1800"))
+CONVERSATION_REHYDRATE_MESSAGES = int(
+    os.getenv("CONVERSATION_REHYDRATE_MESSAGES", "20")
+)
+# Instructions given to the AI in every room, applied as a system message
+AI_ROOM_PROMPT = os.getenv(
+    "Prompt", "Welcome to the chat room! How can I assist you today?"
+)
+
+# "buffer" keeps the last CONVERSATION_BUFFER_MESSAGES messages; "budget" keeps
+# recent turns within CONVERSATION_TOKEN_BUDGET tokens plus a rolling summary
+# of older ones
+CONVERSATION_MEMORY = os.getenv("CONVERSATION_MEMORY", "buffer")
+CONVERSATION_BUFFER_MESSAGES = int(os.getenv("CONVERSATION_BUFFER_MESSAGES", "40"))
+# Saves of a room's shared memory that lost a race with another worker are
+# merged into the newer memory and retried this many times
+CONVERSATION_SAVE_RETRIES = int(os.getenv("CONVERSATION_SAVE_RETRIES", "3"))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "2000"))
+# AI turns run one at a time per room; messages that arrive meanwhile are
+# answered together in one turn when AI_COALESCE_MESSAGES is on
+AI_MAX_CONCURRENT_TURNS = int(os.getenv("AI_MAX_CONCURRENT_TURNS", "8"))
+AI_COALESCE_MESSAGES = os.getenv("AI_COALESCE_MESSAGES", "True") == "True"
+
+# Opt-in cache of AI replies, matched on normalised prompt text or, failing
+# that, on local embedding similarity of at least AI_RESPONSE_CACHE_SIMILARITY
+AI_RESPONSE_CACHE_ENABLED = os.getenv("AI_RESPONSE_CACHE_ENABLED", "False") == "True"
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+AI_RESPONSE_CACHE_TTL = int(os.getenv("AI_RESPONSE_CACHE_TTL", "3600"))
+# Only standalone questions (no room history yet) of at least this many
+# characters are cached; shorter ones are usually context-dependent follow-ups
+AI_RESPONSE_CACHE_MIN_CHARS = int(os.getenv("AI_RESPONSE_CACHE_MIN_CHARS", "20"))
+AI_RESPONSE_CACHE_SIMILARITY = float(os.getenv("AI_RESPONSE_CACHE_SIMILARITY", "0.92"))
+
+# Write-behind message persistence: batches are written with insert_many
+# when MESSAGE_WRITE_BATCH_SIZE messages are queued or after
+# MESSAGE_WRITE_FLUSH_INTERVAL seconds
+MESSAGE_WRITE_BATCH_SIZE = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "100"))
+MESSAGE_WRITE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITE_FLUSH_INTERVAL", "0.5"))
+MESSAGE_WRITE_MAX_QUEUE = int(os.getenv("MESSAGE_WRITE_MAX_QUEUE", "10000"))
+# A failed batch is retried MESSAGE_WRITE_RETRIES times, waiting
+# MESSAGE_WRITE_RETRY_DELAY seconds before the first retry and doubling after
+MESSAGE_WRITE_RETRIES = int(os.getenv("MESSAGE_WRITE_RETRIES", "5"))
+MESSAGE_WRITE_RETRY_DELAY = float(os.getenv("MESSAGE_WRITE_RETRY_DELAY", "0.5"))
+
+# Background initialisation of new rooms (rooms document + chain warm-up):
+# ROOM_INIT_WORKERS threads, batched inserts, and create_room answers 503
+# once ROOM_INIT_MAX_QUEUE rooms are waiting
+ROOM_INIT_WORKERS = int(os.getenv("ROOM_INIT_WORKERS", "2"))
+ROOM_INIT_BATCH_SIZE = int(os.getenv("ROOM_INIT_BATCH_SIZE", "50"))
+ROOM_INIT_FLUSH_INTERVAL = float(os.getenv("ROOM_INIT_FLUSH_INTERVAL", "0.2"))
+ROOM_INIT_MAX_QUEUE = int(os.getenv("ROOM_INIT_MAX_QUEUE", "1000"))
+
+# Serve /api/data/, /api/create_room/ and /api/get_chat_history/ from the
+# async views (Motor-backed) instead of the synchronous DRF views
+USE_ASYNC_VIEWS = os.getenv("USE_ASYNC_VIEWS", "False") == "True"
+
+# Expose Prometheus metrics at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+
+# Where participant counts and conversation memory live: "redis" shares them
+# between workers through REDIS_URL, "local" keeps them in process memory
+ROOM_STATE_BACKEND = os.getenv("ROOM_STATE_BACKEND", "redis")
+ROOM_STATE_TTL = int(os.getenv("ROOM_STATE_TTL", str(7 * 24 * 3600)))
+
+# A WebSocket holds a participant slot while it is connected and renews it
+# every ROOM_HEARTBEAT_INTERVAL seconds; slots not renewed within
+# ROOM_PRESENCE_TTL (e.g. after a worker crash) are freed
+ROOM_HEARTBEAT_INTERVAL = int(os.getenv("ROOM_HEARTBEAT_INTERVAL", "30"))
+ROOM_PRESENCE_TTL = int(os.getenv("ROOM_PRESENCE_TTL", "90"))
+
+# Token-bucket rate limits (api/ratelimit.py), per user and per room, kept in
+# Redis when ROOM_STATE_BACKEND is "redis". "message" covers chat messages sent
+# over the WebSocket, "ai" every AI turn (getReactData and socket messages
+# asking for a reply), "sync" the replays a socket asks for after a reconnect
+# (each one is a Mongo query). Each bucket is (burst, tokens refilled per
+# second) and can be overridden with e.g. RATE_LIMIT_AI_USER_BURST /
+# RATE_LIMIT_AI_USER_RATE.
+# The "user" bucket is the socket connection, or the client address over HTTP
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+# Behind a reverse proxy, take the client address from the last
+# X-Forwarded-For entry (the one the proxy added) instead of REMOTE_ADDR.
+# Off by default, so behind a proxy every HTTP caller shares the proxy's
+# bucket until this is set (see .env.example)
+RATE_LIMIT_TRUST_FORWARDED_FOR = (
+    os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "False") == "True"
+)
+
+
+def token_bucket(name, burst, rate):
+    return (
+        int(os.getenv(f"RATE_LIMIT_{name}_BURST", burst)),
+        float(os.getenv(f"RATE_LIMIT_{name}_RATE", rate)),
+    )
+
+
+RATE_LIMITS = {
+    "message": {
+        "user": token_bucket("MESSAGE_USER", 10, 2),
+        "room": token_bucket("MESSAGE_ROOM", 60, 20),
+    },
+    "ai": {
+        "user": token_bucket("AI_USER", 5, 0.2),
+        "room": token_bucket("AI_ROOM", 15, 1),
+    },
+    "sync": {
+        "user": token_bucket("SYNC_USER", 5, 0.5),
+        "room": token_bucket("SYNC_ROOM", 60, 5),
+    },
+}
+
+# Outbound WebSocket batching (api/outbox.py) for clients that connect with
+# ?batch=1: events within WS_BATCH_WINDOW seconds share one frame, up to
+# WS_BATCH_MAX_EVENTS per frame. Clients that also pass ?compress=deflate get
+# frames of at least WS_COMPRESS_MIN_BYTES as binary zlib data (0 disables)
+WS_BATCH_WINDOW = float(os.getenv("WS_BATCH_WINDOW", "0.025"))
+WS_BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", "50"))
+WS_COMPRESS_MIN_BYTES = int(os.getenv("WS_COMPRESS_MIN_BYTES", "1024"))
+
+# Time allowed for a fresh process to import the ASGI application and URLconf,
+# enforced by `manage.py check_startup`
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1000"))
+
+# Wire format for channel-layer events: "convoroom" is the compact codec in
+# api/codec.py (registered when the api app loads), "msgpack" the stock one
+CHANNEL_LAYER_SERIALIZER = os.getenv("CHANNEL_LAYER_SERIALIZER", "convoroom")
+
 # Channel Layers Configuration
 CHANNEL_LAYERS = {
     "default": {
@@ -89,6 +274,7 @@ CHANNEL_LAYERS = {
             "expiry": 10,
             # Add these for better WebSocket handling
             "symmetric_encryption_keys": [SECRET_KEY],
+            "serializer_format": CHANNEL_LAYER_SERIALIZER,
         },
     },
 }
@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from api.views import *
 from django.urls import re_path, include
 from api.routing import websocket_urlpatterns
 
+if settings.USE_ASYNC_VIEWS:
+    from api.async_views import (
+        async_create_room as create_room,
+        async_getReactData as getReactData,
+        async_get_chat_history as get_chat_history,
+        async_search_room as search_room,
+    )
+
 urlpatterns = [
     # path("admin/", admin.site.urls),
     # path("api/hello/", hello_world),
@@ -12,7 +21,19 @@ urlpatterns = [
     # path("api/insert/", insert_data),
     # path("api/get_chat_history/<str:room_id>/", get_chat_history),
     path("api/join_room/", join_room),
+    path("api/room_status/<str:room_id>/", room_status, name="room_status"),
+    path("api/export_room/<str:room_id>/", export_room, name="export_room"),
+    path("api/import_room/", import_room, name="import_room"),
     path(
         "api/get_chat_history/<str:room_id>/", get_chat_history, name="get_chat_history"
     ),
+    path("api/search/<str:room_id>/", search_room, name="search_room"),
+    path(
+        "api/get_chat_history/<str:room_id>/stream/",
+        stream_chat_history,
+        name="stream_chat_history",
+    ),
 ]
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path("metrics", metrics, name="metrics"))
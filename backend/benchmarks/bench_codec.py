@@ -0,0 +1,103 @@
+"""Micro-benchmark: api.codec against pickle
+
+Run from the backend directory:
+
+    python benchmarks/bench_codec.py [--number 20000]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.codec import (  # noqa: E402
+    decode,
+    encode_event,
+    encode_member,
+    encode_message,
+    encode_room,
+)
+
+SAMPLES = {
+    "room": (
+        encode_room,
+        {
+            "id": "a1b2c3d4",
+            "name": "Weekly sync",
+            "created_at": datetime(2024, 5, 1, 12, 30),
+            "member_count": 3,
+        },
+    ),
+    "member": (
+        encode_member,
+        {
+            "id": 42,
+            "room": "a1b2c3d4",
+            "username": "alice",
+            "is_active_speaker": False,
+            "joined_at": datetime(2024, 5, 1, 12, 31),
+        },
+    ),
+    "message": (
+        encode_message,
+        {
+            "room_id": "a1b2c3d4",
+            "message_id": "9f0c6d1e2b3a4c5d6e7f8091a2b3c4d5",
+            "sender": "alice",
+            "message": "Can someone summarise what we decided about the release?",
+            "timestamp": "2024-05-01T12:32:10.123456",
+        },
+    ),
+    "chat_chunk": (
+        encode_event,
+        {
+            "type": "chat_message",
+            "message": "",
+            "username": "AI",
+            "message_id": "9f0c6d1e2b3a4c5d6e7f8091a2b3c4d5",
+            "event": "chunk",
+            "seq": 12,
+            "delta": " the release",
+        },
+    ),
+}
+
+
+def naive(obj):
+    """Decoded datetimes are UTC-aware; the samples use naive UTC"""
+    return {
+        k: v.replace(tzinfo=None) if isinstance(v, datetime) else v
+        for k, v in obj.items()
+    }
+
+
+def bench(number):
+    print(
+        f"{'payload':<12}{'pickle B':>10}{'codec B':>10}"
+        f"{'pickle enc':>12}{'codec enc':>12}{'pickle dec':>12}{'codec dec':>12}"
+    )
+    for name, (encode, data) in SAMPLES.items():
+        pickled = pickle.dumps(data)
+        encoded = encode(data)
+        assert naive(decode(encoded)) == data, name
+
+        timings = [
+            timeit.timeit(lambda: pickle.dumps(data), number=number),
+            timeit.timeit(lambda: encode(data), number=number),
+            timeit.timeit(lambda: pickle.loads(pickled), number=number),
+            timeit.timeit(lambda: decode(encoded), number=number),
+        ]
+        print(
+            f"{name:<12}{len(pickled):>10}{len(encoded):>10}"
+            + "".join(f"{t / number * 1e6:>10.2f}us" for t in timings)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    bench(parser.parse_args().number)
@@ -0,0 +1,221 @@
+"""End-to-end latency benchmark for the getReactData request path
+
+Drives the real DRF view with the offline stub LLM provider, mongomock in
+place of MongoDB and the in-memory channel layer, and reports per-stage and
+end-to-end p50/p95/p99 for rooms of increasing history size. Run from the
+backend directory (needs `pip install mongomock`). mongomock has no real
+indexes, so "history" grows with room size faster than it would on MongoDB.
+
+    python benchmarks/bench_get_react_data.py --sizes 0 100 1000 --requests 200
+    python benchmarks/bench_get_react_data.py --cold --llm-latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("DATABASE_URL", "mongodb://localhost:27017")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("ROOM_STATE_BACKEND", "local")
+os.environ.setdefault("MONGO_ENSURE_INDEXES", "False")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+os.environ.setdefault("LLM_FALLBACK_PROVIDER", "")
+
+STAGES = (
+    "chain",
+    "history",
+    "inputs",
+    "predict",
+    "group_send",
+    "memory_save",
+    "persist",
+    "end_to_end",
+)
+
+timings = defaultdict(list)
+
+
+class AsyncCursor:
+    """Just enough of Motor's cursor API on top of a mongomock cursor"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    async def to_list(self, length=None):
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def insert_one(self, document):
+        return self._collection.insert_one(document)
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._database[name])
+
+
+def timed(stage, fn):
+    if asyncio.iscoroutinefunction(fn):
+
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def configure(args):
+    """Swap in mongomock and the in-memory layer, then time stages"""
+    import django
+    import mongomock
+    from django.conf import settings
+
+    django.setup()
+    settings.CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    }
+
+    from langchain.chains import ConversationChain
+    from api import ai, db, persistence, services
+
+    # The stub sits behind the same ResilientChatModel as the real provider
+    settings.LLM_STUB_LATENCY = args.llm_latency
+    services.override("mongo", mongomock.MongoClient())
+    db.get_async_db = lambda: AsyncDatabase(db.get_db())
+
+    ConversationChain.apredict = timed("predict", ConversationChain.apredict)
+    ai.aget_room_chain = timed("chain", ai.aget_room_chain)
+    ai.arecent_messages = timed("history", ai.arecent_messages)
+    ai.build_turn_inputs = timed("inputs", ai.build_turn_inputs)
+    ai.broadcast_reply = timed("group_send", ai.broadcast_reply)
+    ai.asave_room_chain = timed("memory_save", ai.asave_room_chain)
+    writer = persistence.message_writer
+    writer.submit = timed("persist", writer.submit)
+    return db.get_db()
+
+
+def seed(database, room_id, size):
+    start = datetime(2024, 1, 1)
+    documents = [
+        {
+            "room_id": room_id,
+            "message_id": f"{room_id}-{index}",
+            "sender": "AI" if index % 2 else f"user{index % 4}",
+            "message": f"Seeded message number {index} for the benchmark room.",
+            "timestamp": (start + timedelta(seconds=index)).isoformat(),
+        }
+        for index in range(size)
+    ]
+    if documents:
+        database["messages"].insert_many(documents)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(size):
+    print(f"\nroom size {size} messages")
+    print(f"  {'stage':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage in STAGES:
+        values = timings.get(stage)
+        if values:
+            print(
+                f"  {stage:<12}{len(values):>6}"
+                + "".join(
+                    f"{percentile(values, pct) * 1000:>10.2f}" for pct in (50, 95, 99)
+                )
+            )
+
+
+def run(args, database):
+    from django.test import RequestFactory
+    from api.conversations import room_conversations
+    from api.views import getReactData
+
+    factory = RequestFactory()
+    for size in args.sizes:
+        room_id = f"bench{size}"
+        seed(database, room_id, size)
+        timings.clear()
+        for index in range(args.requests):
+            if args.cold:
+                # Force every request through chain construction/rehydration
+                room_conversations.pop(room_id)
+            request = factory.post(
+                "/api/data/",
+                data=json.dumps(
+                    {
+                        "message": f"Question {index}: what did we decide?",
+                        "roomId": room_id,
+                        "username": "bench",
+                    }
+                ),
+                content_type="application/json",
+            )
+            start = time.perf_counter()
+            response = getReactData(request)
+            timings["end_to_end"].append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"getReactData failed: {response.data}")
+        report(size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=200, help="per room size")
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0,
+        help="stub model latency per call (LLM_STUB_LATENCY)",
+    )
+    parser.add_argument(
+        "--cold", action="store_true", help="drop the cached chain before each request"
+    )
+    args = parser.parse_args()
+
+    run(args, configure(args))
@@ -0,0 +1,209 @@
+"""Load test for ChatConsumer fan-out through the channel layer
+
+Runs the ASGI application in-process, connects N rooms x M WebSocket clients
+and has every client send chat messages. Each broadcast is matched to its
+send by client id to measure delivery latency; anything not delivered once
+the drain timeout expires is reported as dropped.
+
+The LLM is the offline stub provider and persistence is disabled, so only the
+consumer and the channel layer are measured. Run from the backend directory:
+
+    python benchmarks/loadtest_fanout.py --rooms 10 --clients 4 --messages 50
+    python benchmarks/loadtest_fanout.py --layer redis --redis-url redis://localhost:6379
+    python benchmarks/loadtest_fanout.py --batch  # batched frames (api/outbox.py)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+os.environ.setdefault("ROOM_STATE_BACKEND", "local")
+os.environ.setdefault("MONGO_ENSURE_INDEXES", "False")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+os.environ.setdefault("LLM_FALLBACK_PROVIDER", "")
+
+
+def configure(args):
+    """Point Django at the chosen channel layer and stub out Mongo"""
+    import django
+    from django.conf import settings
+
+    django.setup()
+    if args.layer == "memory":
+        settings.CHANNEL_LAYERS = {
+            "default": {
+                "BACKEND": "channels.layers.InMemoryChannelLayer",
+                "CONFIG": {"capacity": args.capacity, "expiry": 10},
+            }
+        }
+    else:
+        # Same options as production, pointed at a local Redis
+        config = dict(settings.CHANNEL_LAYERS["default"]["CONFIG"])
+        config.update(hosts=[args.redis_url], capacity=args.capacity)
+        settings.CHANNEL_LAYERS = {
+            "default": {
+                "BACKEND": "channels_redis.core.RedisChannelLayer",
+                "CONFIG": config,
+            }
+        }
+
+    from api import ai, conversations, persistence
+
+    async def no_history(room_id, limit=None):
+        return []
+
+    conversations.arecent_messages = no_history
+    ai.arecent_messages = no_history
+    persistence.message_writer.submit = lambda *documents: None
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Client:
+    def __init__(self, application, room, index, batch=False):
+        from channels.testing import WebsocketCommunicator
+
+        self.room = room
+        self.index = index
+        path = f"/ws/room/{room}/" + ("?batch=1" if batch else "")
+        self.communicator = WebsocketCommunicator(application, path)
+        self.latencies = []
+        self.ai_replies = 0
+        self.frames = 0
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError(f"Client {self.index} could not join {self.room}")
+        await self.communicator.receive_from()  # greeting
+
+    async def send(self, seq, ai):
+        payload = {
+            "type": "chat",
+            "message": f"message {seq} from {self.index}",
+            "username": f"user{self.index}",
+            "clientId": f"{self.index}:{seq}:{time.perf_counter()}",
+            "ai": ai,
+        }
+        await self.communicator.send_to(text_data=json.dumps(payload))
+
+    async def receive(self, expected):
+        while len(self.latencies) < expected:
+            frame = json.loads(await self.communicator.receive_from(timeout=3600))
+            self.frames += 1
+            for event in frame if isinstance(frame, list) else [frame]:
+                if event.get("username") == "AI":
+                    self.ai_replies += 1
+                    continue
+                sent_at = float(event["client_id"].rsplit(":", 1)[1])
+                self.latencies.append(time.perf_counter() - sent_at)
+
+
+async def run(args):
+    from backend.asgi import application
+    from api.state import room_state
+
+    for room in range(args.rooms):
+        await room_state.acreate_room(f"load{room}", args.clients)
+    clients = [
+        Client(application, f"load{room}", f"{room}_{index}", args.batch)
+        for room in range(args.rooms)
+        for index in range(args.clients)
+    ]
+    await asyncio.gather(*(client.connect() for client in clients))
+
+    # Every client sees every message of its room, its own included
+    expected = args.clients * args.messages
+    receivers = [asyncio.create_task(client.receive(expected)) for client in clients]
+    interval = 1 / args.rate if args.rate else 0
+
+    async def sender(client):
+        for seq in range(args.messages):
+            await client.send(seq, ai=bool(args.ai_every) and seq % args.ai_every == 0)
+            await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(client) for client in clients))
+    send_elapsed = time.perf_counter() - started
+    _, pending = await asyncio.wait(receivers, timeout=args.drain_timeout)
+    elapsed = time.perf_counter() - started
+    for task in pending:
+        task.cancel()
+    for task in receivers:
+        if task.done() and not task.cancelled() and task.exception():
+            raise task.exception()
+
+    await asyncio.gather(
+        *(client.communicator.disconnect() for client in clients),
+        return_exceptions=True,
+    )
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    sent = len(clients) * args.messages
+    wanted = len(clients) * expected
+    print(
+        f"layer={args.layer} rooms={args.rooms} clients/room={args.clients} "
+        f"messages/client={args.messages}"
+    )
+    print(f"sent:        {sent} in {send_elapsed:.2f}s ({sent / send_elapsed:.0f}/s)")
+    print(
+        f"delivered:   {len(latencies)}/{wanted} in {elapsed:.2f}s "
+        f"({len(latencies) / elapsed:.0f}/s)"
+    )
+    print(f"dropped:     {wanted - len(latencies)}")
+    print(f"frames:      {sum(client.frames for client in clients)}")
+    print(
+        "latency ms:  "
+        + " ".join(
+            f"p{pct}={percentile(latencies, pct) * 1000:.2f}" for pct in (50, 95, 99)
+        )
+        + f" max={max(latencies, default=float('nan')) * 1000:.2f}"
+    )
+    if args.ai_every:
+        print(f"AI replies:  {sum(client.ai_replies for client in clients)}")
+    return wanted - len(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=4, help="clients per room")
+    parser.add_argument("--messages", type=int, default=50, help="per client")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="messages/s per client, 0 = unpaced"
+    )
+    parser.add_argument("--layer", choices=("memory", "redis"), default="memory")
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--capacity", type=int, default=1500)
+    parser.add_argument(
+        "--ai-every",
+        type=int,
+        default=0,
+        help="ask the stub LLM on every Nth message, 0 = never",
+    )
+    parser.add_argument(
+        "--batch", action="store_true", help="connect with ?batch=1 (batched frames)"
+    )
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument(
+        "--fail-on-drop", action="store_true", help="exit 1 if any message is lost"
+    )
+    args = parser.parse_args()
+
+    configure(args)
+    dropped = asyncio.run(run(args))
+    sys.exit(1 if args.fail_on_drop and dropped else 0)
@@ -14,7 +14,7 @@ import { useWebSocket } from "../hooks/useWebSocket";
 import { useMessageDeduplication } from "../hooks/useMessageDeduplication";
 import { useChatHistory } from "../hooks/useChatHistory";
 import { useRecentRooms } from "../hooks/useRecentRooms";
-import { createMessageObject } from "../utils/messageUtils";
+import { createMessageObject, createServerMessage } from "../utils/messageUtils";
 import LoadingSpinner from "./chat/LoadingSpinner";
 import { ConnectionLoadingOverlay } from "./chat/ConnectionLoadingOverlay";
 import ToastManager from "./chat/ToastManager";
@@ -49,6 +49,8 @@ function ChatUI({ roomId: propRoomId, onConnectionChange }) {
   const messagesEndRef = useRef(null);
   const wsRef = useRef(null);
   const messageSenderRef = useRef(null);
+  // message_id of the newest server message this client has seen
+  const lastSeenRef = useRef(null);
 
   // Memoized values
   const roomId = useMemo(
@@ -65,7 +67,11 @@ function ChatUI({ roomId: propRoomId, onConnectionChange }) {
     }
 
     if (!url.endsWith("/")) url += "/";
-    return `${url}ws/room/${roomId}/`;
+    // Ask for batched frames, and compressed ones where the browser can
+    // inflate them
+    const params = new URLSearchParams({ batch: "1" });
+    if (typeof DecompressionStream !== "undefined") params.set("compress", "deflate");
+    return `${url}ws/room/${roomId}/?${params}`;
   }, [roomId]);
 
   // Custom hooks
@@ -77,6 +83,13 @@ function ChatUI({ roomId: propRoomId, onConnectionChange }) {
     BACKEND_URL
   );
 
+  useEffect(() => {
+    const lastServerMessage = messages.findLast((msg) => msg.serverId);
+    if (lastServerMessage && !lastSeenRef.current) {
+      lastSeenRef.current = lastServerMessage.serverId;
+    }
+  }, [messages]);
+
   const handleWebSocketMessage = useCallback(
     (event) => {
       try {
@@ -86,26 +99,138 @@ function ChatUI({ roomId: propRoomId, onConnectionChange }) {
             ? event
             : JSON.parse(event.data);
 
+        // Messages missed while disconnected, replayed after a reconnect
+        if (data.type === "history") {
+          const replayed = data.messages.map(createServerMessage);
+          replayed.forEach((msg) => checkDuplicate(msg.serverId));
+          setMessages((prev) => {
+            // The gap was too large to bridge; start from the server's tail
+            if (data.reset) return replayed;
+            const known = new Set(prev.map((msg) => msg.serverId));
+            return [...prev, ...replayed.filter((msg) => !known.has(msg.serverId))];
+          });
+          if (replayed.length) {
+            lastSeenRef.current = replayed[replayed.length - 1].serverId;
+          }
+          return;
+        }
+
+        // The server refused a message (or its AI reply) for going too fast
+        if (data.type === "rate_limited") {
+          // A refused catch-up is simply asked for again once allowed
+          if (data.scope === "sync") {
+            setTimeout(() => {
+              const ws = wsRef.current;
+              if (ws?.readyState === WebSocket.OPEN && lastSeenRef.current) {
+                ws.send(
+                  JSON.stringify({ type: "sync", since: lastSeenRef.current })
+                );
+              }
+            }, data.retryAfter * 1000);
+            return;
+          }
+          setIsTyping(false);
+          if (data.scope === "message") {
+            setMessages((prev) => prev.filter((msg) => msg.id !== data.clientId));
+          }
+          const seconds = Math.ceil(data.retryAfter);
+          window.showToast?.(
+            data.scope === "ai"
+              ? `AI replies are rate limited, try again in ${seconds}s`
+              : `You're sending messages too fast, try again in ${seconds}s`
+          );
+          return;
+        }
+
         if (data.type !== "chat_message") return;
 
+        // The AI turn failed (timeout, model unavailable); drop any part of
+        // the reply that was already streamed
+        if (data.event === "error") {
+          setIsTyping(false);
+          setMessages((prev) =>
+            prev.filter(
+              (msg) => !(msg.streaming && msg.serverId === data.message_id)
+            )
+          );
+          window.showToast?.("The AI could not answer, please try again");
+          return;
+        }
+
+        // A streamed reply grows chunk by chunk under its message_id; the
+        // final "done" event below replaces it with the complete text
+        if (data.event === "chunk") {
+          setIsTyping(false);
+          setMessages((prev) => {
+            const index = prev.findIndex(
+              (msg) => msg.serverId === data.message_id
+            );
+            if (index === -1) {
+              return [
+                ...prev,
+                createMessageObject("AI", data.delta, {
+                  serverId: data.message_id,
+                  streaming: true,
+                  seq: data.seq,
+                }),
+              ];
+            }
+            const streamed = prev[index];
+            // Already finished, or a chunk seen before
+            if (!streamed.streaming || data.seq <= streamed.seq) return prev;
+            const next = [...prev];
+            next[index] = createMessageObject("AI", streamed.text + data.delta, {
+              id: streamed.id,
+              timestamp: streamed.timestamp,
+              serverId: data.message_id,
+              streaming: true,
+              seq: data.seq,
+            });
+            return next;
+          });
+          if (!showScrollButton) {
+            requestAnimationFrame(() => {
+              messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+            });
+          }
+          return;
+        }
+
+        if (data.event && data.event !== "done") return;
+
+        // Our own echo counts as seen even though it is not rendered again
+        if (data.message_id) lastSeenRef.current = data.message_id;
+
         const messageSender = data.username || "Unknown";
 
         if (messageSender === username) return;
 
-        if (messageSender === "AI") return;
+        if (messageSender === "AI") setIsTyping(false);
 
-        const messageKey = `${messageSender}-${data.message}`;
+        const messageKey = data.message_id || `${messageSender}-${data.message}`;
         if (checkDuplicate(messageKey)) return;
 
-        const newMessage = createMessageObject(messageSender, data.message);
+        const newMessage = createMessageObject(messageSender, data.message, {
+          serverId: data.message_id,
+        });
 
         setMessages((prev) => {
+          const streamed = prev.findIndex(
+            (msg) => msg.streaming && msg.serverId === data.message_id
+          );
+          if (streamed !== -1) {
+            const next = [...prev];
+            next[streamed] = { ...newMessage, id: prev[streamed].id };
+            return next;
+          }
+
           const isDuplicate = prev.some(
             (msg) =>
-              msg.sender === messageSender &&
-              msg.text === data.message &&
-              Math.abs(new Date(msg.timestamp).getTime() - Date.now()) <
-                MESSAGE_DEDUPE_WINDOW
+              (data.message_id && msg.serverId === data.message_id) ||
+              (msg.sender === messageSender &&
+                msg.text === data.message &&
+                Math.abs(new Date(msg.timestamp).getTime() - Date.now()) <
+                  MESSAGE_DEDUPE_WINDOW)
           );
 
           if (isDuplicate) return prev;
@@ -124,13 +249,21 @@ function ChatUI({ roomId: propRoomId, onConnectionChange }) {
     [username, checkDuplicate, setMessages, showScrollButton]
   );
 
+  // On every (re)connect, ask for whatever arrived after the last message seen
+  const handleSocketOpen = useCallback((ws) => {
+    if (lastSeenRef.current) {
+      ws.send(JSON.stringify({ type: "sync", since: lastSeenRef.current }));
+    }
+  }, []);
+
   // WebSocket connection
   const { isConnected, wsRef: hookWsRef } = useWebSocket(
     wsUrl,
     username,
     roomId,
     handleWebSocketMessage,
-    onConnectionChange
+    onConnectionChange,
+    handleSocketOpen
   );
 
   // Use the wsRef from the hook
@@ -27,17 +27,23 @@ const MessageSender = forwardRef(
         try {
           onTypingChange(true);
 
-          // Send via WebSocket
+          // One hop: the server stores and broadcasts the message and
+          // queues the AI reply, which is streamed back over the socket
           if (wsRef.current?.readyState === WebSocket.OPEN) {
             wsRef.current.send(
               JSON.stringify({
+                type: "chat",
                 message: messageToSend,
                 username,
+                clientId: userMessage.id,
+                ai: true,
+                stream: true,
               })
             );
+            return;
           }
 
-          // Send to API
+          // Fallback when the socket is down
           const response = await fetch(`${backendUrl}api/data/`, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
@@ -48,6 +54,14 @@ const MessageSender = forwardRef(
             }),
           });
 
+          if (response.status === 429) {
+            const retryAfter = response.headers.get("Retry-After") || "a few";
+            onError(userMessage.id);
+            onTypingChange(false);
+            window.showToast?.(`Too many requests, try again in ${retryAfter}s`);
+            return;
+          }
+
           if (!response.ok) {
             throw new Error(
               `API Error: ${response.status} ${response.statusText}`
@@ -61,11 +75,11 @@ const MessageSender = forwardRef(
             const aiMessage = createMessageObject("AI", aiResponse);
             onMessageSent(aiMessage);
           }
+          onTypingChange(false);
         } catch (error) {
           onError(userMessage.id);
-          window.showToast?.("Failed to send message. Please try again.");
-        } finally {
           onTypingChange(false);
+          window.showToast?.("Failed to send message. Please try again.");
         }
       },
       [
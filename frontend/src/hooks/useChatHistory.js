@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { createMessageObject, generateMessageId } from '../utils/messageUtils';
+import { createServerMessage } from '../utils/messageUtils';
 
 const NEW_ROOM_THRESHOLD = 2000;
 
@@ -41,12 +41,7 @@ export const useChatHistory = (roomId, username, backendUrl) => {
           return;
         }
 
-        const formattedMessages = data.messages.map((msg) =>
-          createMessageObject(msg.sender, msg.message, {
-            id: generateMessageId(msg.sender, msg.message),
-            timestamp: msg.timestamp,
-          })
-        );
+        const formattedMessages = data.messages.map(createServerMessage);
 
         setMessages(formattedMessages);
       } catch (error) {
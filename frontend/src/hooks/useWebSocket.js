@@ -1,14 +1,26 @@
 import { useRef, useEffect, useCallback, useState } from 'react';
 
-export const useWebSocket = (wsUrl, username, roomId, onMessage, onConnectionChange) => {
+// Binary frames are zlib-compressed JSON (the server's ?compress=deflate)
+const decodeFrame = async (data) => {
+  if (typeof data === 'string') return data;
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Response(stream).text();
+};
+
+export const useWebSocket = (wsUrl, username, roomId, onMessage, onConnectionChange, onOpen) => {
   const [isConnected, setIsConnected] = useState(false);
   const [reconnectAttempts, setReconnectAttempts] = useState(0);
   const wsRef = useRef(null);
+  // Frames are decoded one after another so a compressed frame is never
+  // overtaken by a plain one that arrived after it
+  const receiveChainRef = useRef(Promise.resolve());
   const reconnectTimeoutRef = useRef(null);
   const connectionTimeoutRef = useRef(null);
   const MAX_RECONNECT_ATTEMPTS = 5;
   const RECONNECT_INTERVAL = 3000;
   const CONNECTION_TIMEOUT = 10000; // 10 seconds
+  // Normal closures, plus the server refusing a slot (room full / not found)
+  const NO_RECONNECT_CODES = [1000, 1001, 4003, 4004];
 
   const cleanup = useCallback(() => {
     if (connectionTimeoutRef.current) {
@@ -21,23 +33,28 @@ export const useWebSocket = (wsUrl, username, roomId, onMessage, onConnectionCha
     }
   }, []);
 
-  const handleOpen = useCallback(() => {
+  const handleOpen = useCallback((event) => {
     cleanup();
     setIsConnected(true);
     setReconnectAttempts(0);
     onConnectionChange?.(true);
-  }, [onConnectionChange, cleanup]);
+    onOpen?.(event.target);
+  }, [onConnectionChange, onOpen, cleanup]);
 
   const handleMessage = useCallback((event) => {
-    try {
-      if (!event.data || event.data === 'undefined' || event.data.trim() === '') {
-        return;
-      }
-      const data = JSON.parse(event.data);
-      onMessage?.(data);
-    } catch (error) {
-      // Silently handle parse errors in production
-    }
+    receiveChainRef.current = receiveChainRef.current
+      .then(() => decodeFrame(event.data))
+      .then((text) => {
+        if (!text || text === 'undefined' || text.trim() === '') {
+          return;
+        }
+        const data = JSON.parse(text);
+        // Batched frames carry a JSON array of events
+        (Array.isArray(data) ? data : [data]).forEach((item) => onMessage?.(item));
+      })
+      .catch(() => {
+        // Silently handle parse errors in production
+      });
   }, [onMessage]);
 
   const handleError = useCallback((error) => {
@@ -52,7 +69,7 @@ export const useWebSocket = (wsUrl, username, roomId, onMessage, onConnectionCha
     onConnectionChange?.(false);
     
     // Only attempt reconnection for abnormal closures
-    if (event.code !== 1000 && event.code !== 1001 && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
+    if (!NO_RECONNECT_CODES.includes(event.code) && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
       const delay = RECONNECT_INTERVAL * Math.pow(1.5, reconnectAttempts); // Exponential backoff
       
       reconnectTimeoutRef.current = setTimeout(() => {
@@ -83,6 +100,7 @@ export const useWebSocket = (wsUrl, username, roomId, onMessage, onConnectionCha
 
     try {
       const ws = new WebSocket(wsUrl);
+      ws.binaryType = "arraybuffer";
       wsRef.current = ws;
 
       // Set connection timeout
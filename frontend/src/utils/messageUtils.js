@@ -50,3 +50,12 @@ export const createMessageObject = (sender, text, additionalProps = {}) => {
     ...additionalProps,
   };
 };
+
+// Messages stored by the server (chat history, reconnect replay) keep their
+// server message_id so replays can be merged without duplicates
+export const createServerMessage = (msg) =>
+  createMessageObject(msg.sender, msg.message, {
+    id: generateMessageId(msg.sender, msg.message),
+    serverId: msg.message_id,
+    timestamp: msg.timestamp,
+  });